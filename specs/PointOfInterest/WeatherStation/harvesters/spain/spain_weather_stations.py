@@ -33,19 +33,19 @@
     async def name_one - worker process
 """
 
-from aiohttp import ClientSession, ClientConnectorError
-from asyncio import Semaphore, ensure_future, gather, run, TimeoutError as ToE, set_event_loop_policy
+from asyncio import ensure_future, gather, new_event_loop, set_event_loop_policy
 from argparse import ArgumentTypeError, ArgumentParser
 from copy import deepcopy
 from csv import DictWriter
 from datetime import datetime
 from io import BytesIO
+from os.path import abspath, dirname, join
 from re import sub
 from requests import get, exceptions
-from sys import stdout
+from sys import path as python_path, stdout
 from uvloop import EventLoopPolicy
 from xlrd import open_workbook
-from yajl import loads, dumps
+from yajl import loads
 from yaml import safe_load as load, dump
 from zipfile import ZipFile
 import logging
@@ -54,6 +54,9 @@ default_limit_entities = 50           # amount of entities per 1 request to Orio
 default_limit_targets = 50            # amount of parallel request to Orion
 default_log_level = 'INFO'
 default_orion = 'http://orion:1026'
+default_validation_budget = 1          # validation cost budget, milliseconds per entity
+default_spool_size = 100               # spool size limit, MB
+default_tools = join(dirname(abspath(__file__)), '..', '..', '..', '..', '..', 'tools')  # Data Models tools
 
 http_ok = [200, 201, 204]
 
@@ -226,85 +229,6 @@ def log_level_to_int(log_level_string):
     return getattr(logging, log_level_string, logging.ERROR)
 
 
-async def post(body):
-    logger.debug('Posting data to Orion started')
-
-    tasks = list()
-
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    if service:
-        headers['FIWARE-SERVICE'] = service
-
-    if path:
-        headers['FIWARE-SERVICEPATH'] = path
-
-    sem = Semaphore(limit_targets)
-
-    # splitting list to list of lists to fit into limits
-    block = 0
-    items = 0
-    body_divided = dict()
-    body_divided[0] = list()
-    while True:
-        if len(body) > 0:
-            if items < limit_entities:
-                body_divided[block].append(body.pop())
-                items += 1
-            else:
-                items = 0
-                block += 1
-                body_divided[block] = list()
-        else:
-            break
-
-    async with ClientSession() as session:
-        for item in body_divided:
-            task = ensure_future(post_bounded(body_divided[item], headers, sem, session))
-            tasks.append(task)
-
-        response = await gather(*tasks)
-
-    response = list(set(response))
-    if True in response:
-        response.remove(True)
-
-    for item in response:
-        logger.error('Posting data to Orion failed due to the %s', item)
-
-    logger.debug('Posting data to Orion ended')
-    return True
-
-
-async def post_bounded(el, headers, sem, session):
-    async with sem:
-        return await post_one(el, headers, session)
-
-
-async def post_one(el, headers, session):
-    payload = {
-        'actionType': 'APPEND',
-        'entities': el
-    }
-
-    payload = dumps(payload)
-
-    url = orion + '/v2/op/update'
-    try:
-        async with session.post(url, headers=headers, data=payload) as response:
-            status = response.status
-    except ClientConnectorError:
-        return 'connection problem'
-    except ToE:
-        return 'timeout problem'
-
-    if status not in http_ok:
-        return 'response code ' + str(status)
-
-    return True
-
-
 async def prepare_data(aemet_data, ine_data):
     logger.debug('Data preparation started')
 
@@ -523,6 +447,24 @@ if __name__ == '__main__':
                         dest="service",
                         help='FIWARE Service')
 
+    parser.add_argument('--spool',
+                        action='store',
+                        dest='spool',
+                        help='Folder of the spool of the batches not accepted by Orion, sent again later')
+    parser.add_argument('--spool-size',
+                        default=default_spool_size,
+                        dest='spool_size',
+                        help='Limit the size of the spool (MB), beyond it the oldest batches are dropped')
+    parser.add_argument('--validate',
+                        const=default_tools,
+                        dest='validate',
+                        help='Validate the entities against the Data Model schemas (tools folder of the repository)',
+                        nargs='?')
+    parser.add_argument('--validation-budget',
+                        default=default_validation_budget,
+                        dest='validation_budget',
+                        help='Validation cost budget in milliseconds per entity (beyond it 1 out of N is validated)')
+
     args = parser.parse_args()
 
     limit_entities = int(args.limit_entities)
@@ -536,7 +478,18 @@ if __name__ == '__main__':
 
     logger, logger_req = setup_logger()
 
+    if args.validate:
+        python_path.insert(0, args.validate)
+        from harvest_validation import setup_validation, validate_entities, validation_report
+        setup_validation(['PointOfInterest'], float(args.validation_budget) / 1000)
+
+    python_path.append(default_tools)
+    from orion_writer import setup_writer, post, close_writer, writer_report
+    setup_writer(orion, service, path, limit_entities, limit_targets, spool=args.spool,
+                 spool_bytes=int(args.spool_size) * 1024 * 1024)
+
     set_event_loop_policy(EventLoopPolicy())
+    loop = new_event_loop()
 
     logger.info('Started')
 
@@ -552,7 +505,7 @@ if __name__ == '__main__':
         aemet = collect_aemet(args.key)
         ine = collect_ine()
 
-        res = run(prepare_data(aemet, ine))
+        res = loop.run_until_complete(prepare_data(aemet, ine))
 
         logger.debug('Initial data collection ended')
     else:
@@ -567,7 +520,7 @@ if __name__ == '__main__':
     if args.csv:
         fieldnames = ['id', 'country', 'community', 'province', 'locality', 'latitude', 'longitude', 'timezone']
 
-        res = run(prepare_schema(res, True))
+        res = loop.run_until_complete(prepare_schema(res, True))
 
         with open(stations_file_csv, 'w', encoding='utf8') as file:
             writer = DictWriter(file, fieldnames=fieldnames)
@@ -583,8 +536,14 @@ if __name__ == '__main__':
     if not args.yml and not args.csv:
         reply_status(res)
 
-        res = run(prepare_schema(res))
-        run(post(res))
+        res = loop.run_until_complete(prepare_schema(res))
+        if args.validate:
+            res = validate_entities(res, logger)
+            logger.info('Validation: %s', validation_report())
+        loop.run_until_complete(post(res))
+        logger.info('Orion: %s', writer_report())
+
+    loop.run_until_complete(close_writer())
 
     logger.info('Ended')
     exit(0)
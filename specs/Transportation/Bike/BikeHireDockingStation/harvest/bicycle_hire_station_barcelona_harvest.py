@@ -4,19 +4,26 @@
 """
 Harmonises data from the city of Barcelona corresponding to
 the bicycle hiring stations
+
+With --interval the stations are polled every N seconds (e.g. 30). The last
+snapshot is kept in memory and only the attributes which changed (usually
+availableBikeNumber, freeSlotNumber and status) are sent, in a single batch.
+The static attributes (address, location) are sent only when they change.
 """
 
 from __future__ import print_function
+import argparse
 import contextlib
 import json
+import time
 from datetime import datetime
 from pytz import timezone
 import re
 try:                 # Python 3
     from urllib.request import Request, urlopen
-    from urllib.error import URLError
+    from urllib.error import HTTPError, URLError
 except ImportError:  # Python 2
-    from urllib2 import Request, URLError, urlopen
+    from urllib2 import HTTPError, Request, URLError, urlopen
 
 
 # Origin of the Data (Barcelona's open data)
@@ -115,7 +122,33 @@ def harmonize_station(station_data):
     return out
 
 
+# Attributes of a station which changed since the previous snapshot, with the
+# id and type of the station (None if nothing changed). Metadata are not
+# compared, as the timestamp changes at every poll. New stations go whole
+def changed_attributes(previous, current):
+    if previous is None:
+        return current
+
+    out = {}
+
+    for name, attribute in current.items():
+        if name in ['id', 'type']:
+            continue
+        if name not in previous or previous[name]['type'] != attribute['type'] or \
+                previous[name]['value'] != attribute['value']:
+            out[name] = attribute
+
+    if len(out) == 0:
+        return None
+
+    out['id'] = current['id']
+    out['type'] = current['type']
+
+    return out
+
+
 # Persists the data to a Data Broker supporting FIWARE NGSI v2
+# Returns True if the Data Broker accepted it
 def persist_data(entity_list):
     # print json.dumps(entity_list)
 
@@ -136,23 +169,27 @@ def persist_data(entity_list):
         url=(
             DATA_BROKER +
             '/v2/op/update'),
-        data=data_as_str,
+        data=data_as_str.encode('utf-8'),
         headers=headers)
 
     try:
         with contextlib.closing(urlopen(req)) as f:
             print('Entities successfully created')
-    except URLError as e:
+            return True
+    except HTTPError as e:
         print('Error while POSTing data to Orion: %d %s' % (e.code, e.read()))
+    except URLError as e:
+        print('Error while POSTing data to Orion: %s' % e.reason)
 
+    return False
 
-# Main module
-def main():
+
+# Reads and harmonises all the stations (None if the source could not be read)
+def read_stations():
     data = read_data(SOURCE)
 
     if data is None:
-        print("Source data could not be read")
-        exit()
+        return None
 
     parsed_data = json.loads(data)
 
@@ -164,8 +201,61 @@ def main():
         h_station = harmonize_station(station)
         ngsi_data.append(h_station)
 
+    return ngsi_data
+
+
+# High frequency mode: polls the stations every interval seconds and sends
+# only the changes. The snapshot is updated once the Data Broker accepted them,
+# so the changes which could not be sent go again in the next poll
+def poll(interval):
+    snapshot = {}
+
+    while True:
+        start = time.time()
+
+        ngsi_data = read_stations()
+
+        if ngsi_data is None:
+            print("Source data could not be read")
+        else:
+            updates = []
+            for station in ngsi_data:
+                update = changed_attributes(snapshot.get(station['id']), station)
+                if update is not None:
+                    updates.append(update)
+
+            attributes = sum(len(update) - 2 for update in updates)
+            print('%d stations, %d changed (%d attributes)' % (len(ngsi_data), len(updates), attributes))
+
+            if len(updates) == 0 or persist_data(updates):
+                for station in ngsi_data:
+                    snapshot[station['id']] = station
+
+        time.sleep(max(0, interval - (time.time() - start)))
+
+
+# Main module
+def main(interval=None):
+    if interval:
+        poll(interval)
+        return
+
+    ngsi_data = read_stations()
+
+    if ngsi_data is None:
+        print("Source data could not be read")
+        exit()
+
     persist_data(ngsi_data)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(
+        description='Barcelona bike hire docking stations harvester')
+    parser.add_argument('--interval', metavar='seconds', type=int,
+                        help='Poll the stations every N seconds (e.g. 30) '
+                             'and send only the changed attributes')
+
+    args = parser.parse_args()
+
+    main(args.interval)
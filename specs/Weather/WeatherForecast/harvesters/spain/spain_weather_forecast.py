@@ -26,29 +26,33 @@
     This limit will be removed in the next version.
 """
 
-from aiohttp import ClientSession, ClientConnectorError
+from aiohttp import ClientSession, ClientConnectorError, ClientError, ClientTimeout
 from argparse import ArgumentTypeError, ArgumentParser
-from asyncio import Semaphore, ensure_future, gather, run, TimeoutError as ToE, set_event_loop_policy
+from asyncio import Semaphore, ensure_future, gather, new_event_loop, TimeoutError as ToE, set_event_loop_policy, sleep
 from copy import deepcopy
 from datetime import datetime, timedelta
+from os.path import abspath, dirname, join
 from pytz import timezone
 from re import sub
-from requests import get, exceptions
-from sys import stdout
-from time import sleep
+from sys import path as python_path, stdout
 from uvloop import EventLoopPolicy
-from yajl import dumps, loads
+from yajl import loads
 from yaml import safe_load as load
 import logging
 
 default_latest = False                 # preserve only latest values
 default_limit_entities = 50            # amount of entities per 1 request to Orion
+default_limit_datos = 10               # amount of parallel request to the data links of AEMET
 default_limit_source = 10              # amount of parallel request to AEMET
 default_limit_target = 50              # amount of parallel request to Orion
 default_log_level = 'INFO'
 default_orion = 'http://orion:1026'    # Orion Contest Broker endpoint
+default_source_timeout = 60            # timeout of every request to AEMET, seconds
 default_station_file = 'stations.yml'  # source file with list of municipalities
 default_timeout = -1                   # if value != -1, then work as a service
+default_validation_budget = 1          # validation cost budget, milliseconds per entity
+default_spool_size = 100               # spool size limit, MB
+default_tools = join(dirname(abspath(__file__)), '..', '..', '..', '..', '..', 'tools')  # Data Models tools
 
 http_ok = [200, 201, 204]
 
@@ -148,16 +152,19 @@ template = {
 }
 
 
+# Every forecast takes two requests: the link to the data (limited to limit_source
+# parallel requests) and the data (limited to limit_datos parallel requests)
 async def collect(key):
     logger.debug('Collecting data from AEMET started')
 
     tasks = list()
 
     sem = Semaphore(limit_source)
+    sem_datos = Semaphore(limit_datos)
 
-    async with ClientSession() as session:
+    async with ClientSession(timeout=ClientTimeout(total=source_timeout)) as session:
         for station in stations:
-            task = ensure_future(collect_bounded(station, sem, session, key))
+            task = ensure_future(collect_one(station, sem, sem_datos, session, key))
             tasks.append(task)
 
         result = await gather(*tasks)
@@ -169,20 +176,18 @@ async def collect(key):
     return result
 
 
-async def collect_bounded(station, sem, session, key):
-    async with sem:
-        return await collect_one(station, session, key)
-
-
-async def collect_one(station, session, key):
+async def collect_one(station, sem, sem_datos, session, key):
 
     try:
-        async with session.get(stations[station]['url'], headers={'api_key': key}, ssl=False) as response:
+        async with sem, session.get(stations[station]['url'], headers={'api_key': key}, ssl=False) as response:
             result = await response.read()
             status = response.status
     except ClientConnectorError:
         logger.error('Collecting link from AEMET station %s failed due to the connection problem', station)
         return False
+    except ClientError as e:
+        logger.error('Collecting link from AEMET station %s failed due to the client error (%s)', station, e)
+        return False
     except ToE:
         logger.error('Collecting link from AEMET station %s failed due to the timeout problem', station)
         return False
@@ -195,17 +200,24 @@ async def collect_one(station, session, key):
     result = loads(result.decode('UTF-8'))
 
     try:
-        content = get(result['datos'])
-    except exceptions.ConnectionError:
+        async with sem_datos, session.get(result['datos'], ssl=False) as response:
+            content = await response.text()
+            status = response.status
+    except ClientConnectorError:
         logger.error('Collecting data from AEMET station %s failed due to the connection problem', station)
         return False
+    except ClientError as e:
+        logger.error('Collecting data from AEMET station %s failed due to the client error (%s)', station, e)
+        return False
+    except ToE:
+        logger.error('Collecting data from AEMET station %s failed due to the timeout problem', station)
+        return False
 
-    if content.status_code not in http_ok:
-        logger.error('Collecting data from AEMET station %s failed due to the return code %s', station,
-                     str(response.status))
+    if status not in http_ok:
+        logger.error('Collecting data from AEMET station %s failed due to the return code %s', station, str(status))
         return False
 
-    content = loads(content.text)
+    content = loads(content)
 
     result = dict()
     result['station'] = station
@@ -365,84 +377,6 @@ def log_level_to_int(log_level_string):
     return getattr(logging, log_level_string, logging.ERROR)
 
 
-async def post(body):
-    logger.debug('Posting data to Orion started')
-
-    tasks = list()
-
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    if service:
-        headers['FIWARE-SERVICE'] = service
-
-    if path:
-        headers['FIWARE-SERVICEPATH'] = path
-
-    sem = Semaphore(limit_target)
-
-    # splitting list to list of lists to fit into limits
-    block = 0
-    items = 0
-    body_divided = dict()
-    body_divided[0] = list()
-    while True:
-        if len(body) > 0:
-            if items < limit_entities:
-                body_divided[block].append(body.pop())
-                items += 1
-            else:
-                items = 0
-                block += 1
-                body_divided[block] = list()
-        else:
-            break
-
-    async with ClientSession() as session:
-        for item in body_divided:
-            task = ensure_future(post_bounded(body_divided[item], headers, sem, session))
-            tasks.append(task)
-
-        response = await gather(*tasks)
-
-    response = list(set(response))
-    if True in response:
-        response.remove(True)
-
-    for item in response:
-        logger.error('Posting data to Orion failed due to the %s', item)
-
-    logger.debug('Posting data to Orion ended')
-
-
-async def post_bounded(item, headers, sem, session):
-    async with sem:
-        return await post_one(item, headers, session)
-
-
-async def post_one(item, headers, session):
-    payload = {
-        'actionType': 'APPEND',
-        'entities': item
-    }
-
-    payload = dumps(payload)
-
-    url = orion + '/v2/op/update'
-    try:
-        async with session.post(url, headers=headers, data=payload) as response:
-            status = response.status
-    except ClientConnectorError:
-        return 'connection problem'
-    except ToE:
-        return 'timeout problem'
-
-    if status not in http_ok:
-        return 'response code ' + str(status)
-
-    return True
-
-
 async def prepare_schema(source):
     logger.debug('Schema preparation started')
 
@@ -597,6 +531,8 @@ def reply_status():
     logger.info('Latest: %s', str(latest))
     logger.info('limit_entities: %s', str(limit_entities))
     logger.info('Limit_source: %s', str(limit_source))
+    logger.info('Limit_datos: %s', str(limit_datos))
+    logger.info('Source timeout: %s', str(source_timeout))
     logger.info('limit_target: %s', str(limit_target))
     logger.info('Log level: %s', args.log_level)
     logger.info('Started')
@@ -703,6 +639,10 @@ def setup_config_re(station):
 
 if __name__ == '__main__':
     parser = ArgumentParser()
+    parser.add_argument('--cache',
+                        action='store',
+                        dest='cache',
+                        help='File of the change detection cache (only new or changed entities are sent to Orion)')
     parser.add_argument('--config',
                         dest='config',
                         help='YAML file with list of municipalities to be collected or excluded from collecting')
@@ -716,6 +656,10 @@ if __name__ == '__main__':
                         default=default_latest,
                         dest='latest',
                         help='Collect only latest forecast')
+    parser.add_argument('--limit-datos',
+                        default=default_limit_datos,
+                        dest='limit_datos',
+                        help='Limit amount of parallel requests to the data links of AEMET')
     parser.add_argument('--limit-entities',
                         default=default_limit_entities,
                         dest='limit_entities',
@@ -746,6 +690,18 @@ if __name__ == '__main__':
                         action='store',
                         dest="service",
                         help='FIWARE Service')
+    parser.add_argument('--source-timeout',
+                        default=default_source_timeout,
+                        dest='source_timeout',
+                        help='Timeout of every request to AEMET (seconds)')
+    parser.add_argument('--spool',
+                        action='store',
+                        dest='spool',
+                        help='Folder of the spool of the batches not accepted by Orion, sent again later')
+    parser.add_argument('--spool-size',
+                        default=default_spool_size,
+                        dest='spool_size',
+                        help='Limit the size of the spool (MB), beyond it the oldest batches are dropped')
     parser.add_argument('--stations',
                         action='store',
                         default=default_station_file,
@@ -756,14 +712,25 @@ if __name__ == '__main__':
                         default=default_timeout,
                         dest='timeout',
                         help='Run as a service')
+    parser.add_argument('--validate',
+                        const=default_tools,
+                        dest='validate',
+                        help='Validate the entities against the Data Model schemas (tools folder of the repository)',
+                        nargs='?')
+    parser.add_argument('--validation-budget',
+                        default=default_validation_budget,
+                        dest='validation_budget',
+                        help='Validation cost budget in milliseconds per entity (beyond it 1 out of N is validated)')
 
     args = parser.parse_args()
 
     latest = args.latest
     limit_entities = int(args.limit_entities)
+    limit_datos = int(args.limit_datos)
     limit_source = int(args.limit_source)
     limit_target = int(args.limit_target)
     orion = args.orion
+    source_timeout = int(args.source_timeout)
     timeout = int(args.timeout)
 
     if 'path' in args:
@@ -773,7 +740,22 @@ if __name__ == '__main__':
 
     logger, logger_req = setup_logger()
 
+    if args.validate:
+        python_path.insert(0, args.validate)
+        from harvest_validation import setup_validation, validate_entities, validation_report
+        setup_validation(['WeatherForecast'], float(args.validation_budget) / 1000)
+
+    python_path.append(default_tools)
+    from orion_writer import setup_writer, post, close_writer, writer_report, delivered
+    setup_writer(orion, service, path, limit_entities, limit_target, spool=args.spool,
+                 spool_bytes=int(args.spool_size) * 1024 * 1024)
+
+    if args.cache:
+        from change_cache import setup_cache, select_changed, commit_changes, cache_report
+        setup_cache(args.cache, ['dateRetrieved'])
+
     set_event_loop_policy(EventLoopPolicy())
+    loop = new_event_loop()
 
     res = setup_stations_config(args.config)
     stations = setup_stations(res, args.station_file)
@@ -781,15 +763,26 @@ if __name__ == '__main__':
     reply_status()
 
     while True:
-        res = run(collect(args.key))
+        res = loop.run_until_complete(collect(args.key))
         if res:
-            res = run(prepare_schema(res))
-            run(post(res))
+            res = loop.run_until_complete(prepare_schema(res))
+            if args.cache:
+                res = select_changed(res)
+            if args.validate:
+                res = validate_entities(res, logger)
+                logger.info('Validation: %s', validation_report())
+            loop.run_until_complete(post(res))
+            logger.info('Orion: %s', writer_report())
+            if args.cache:
+                commit_changes(delivered)
+                logger.info('Cache: %s', cache_report())
         if timeout == -1:
             break
         else:
             logger.debug('Sleeping for the %s seconds', timeout)
-            sleep(timeout)
+            loop.run_until_complete(sleep(timeout))
+
+    loop.run_until_complete(close_writer())
 
     logger.info('Ended')
     exit(0)
@@ -20,17 +20,16 @@
     async def name_one - worker process
 """
 
-from aiohttp import ClientSession, ClientConnectorError
 from argparse import ArgumentTypeError, ArgumentParser
-from asyncio import Semaphore, ensure_future, gather, run, TimeoutError as ToE, set_event_loop_policy
+from asyncio import ensure_future, gather, new_event_loop, set_event_loop_policy, sleep
 from copy import deepcopy
 from datetime import datetime
+from os.path import abspath, dirname, join
 from pytz import timezone
 from re import sub
-from sys import stdout
-from time import sleep
+from sys import path as python_path, stdout
 from uvloop import EventLoopPolicy
-from yajl import dumps, loads
+from yajl import loads
 from yaml import safe_load as load
 from requests import get, exceptions
 import logging
@@ -42,6 +41,9 @@ default_log_level = 'INFO'
 default_station_file = 'stations.yml'  # source file with list of municipalities
 default_orion = 'http://orion:1026'    # Orion Contest Broker endpoint
 default_timeout = -1                   # if value != -1, then work as a service
+default_validation_budget = 1          # validation cost budget, milliseconds per entity
+default_spool_size = 100               # spool size limit, MB
+default_tools = join(dirname(abspath(__file__)), '..', '..', '..', '..', '..', 'tools')  # Data Models tools
 
 http_ok = [200, 201, 204]
 
@@ -219,84 +221,6 @@ def log_level_to_int(log_level_string):
     return getattr(logging, log_level_string, logging.ERROR)
 
 
-async def post(body):
-    logger.debug('Posting data to Orion started')
-
-    tasks = list()
-
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    if service:
-        headers['FIWARE-SERVICE'] = service
-
-    if path:
-        headers['FIWARE-SERVICEPATH'] = path
-
-    sem = Semaphore(limit_target)
-
-    # splitting list to list of lists to fit into limits
-    block = 0
-    items = 0
-    body_divided = dict()
-    body_divided[0] = list()
-    while True:
-        if len(body) > 0:
-            if items < limit_entities:
-                body_divided[block].append(body.pop())
-                items += 1
-            else:
-                items = 0
-                block += 1
-                body_divided[block] = list()
-        else:
-            break
-
-    async with ClientSession() as session:
-        for item in body_divided:
-            task = ensure_future(post_bounded(body_divided[item], headers, sem, session))
-            tasks.append(task)
-
-        response = await gather(*tasks)
-
-    response = list(set(response))
-    if True in response:
-        response.remove(True)
-
-    for item in response:
-        logger.error('Posting data to Orion failed due to the %s', item)
-
-    logger.debug('Posting data to Orion ended')
-
-
-async def post_bounded(item, headers, sem, session):
-    async with sem:
-        return await post_one(item, headers, session)
-
-
-async def post_one(item, headers, session):
-    payload = {
-        'actionType': 'APPEND',
-        'entities': item
-    }
-
-    payload = dumps(payload)
-
-    url = orion + '/v2/op/update'
-    try:
-        async with session.post(url, headers=headers, data=payload) as response:
-            status = response.status
-    except ClientConnectorError:
-        return 'connection problem'
-    except ToE:
-        return 'timeout problem'
-
-    if status not in http_ok:
-        return 'response code ' + str(status)
-
-    return True
-
-
 async def prepare_schema(source):
     logger.debug('Schema preparation started')
 
@@ -490,6 +414,10 @@ def setup_config_re(station):
 if __name__ == '__main__':
 
     parser = ArgumentParser()
+    parser.add_argument('--cache',
+                        action='store',
+                        dest='cache',
+                        help='File of the change detection cache (only new or changed entities are sent to Orion)')
     parser.add_argument('--config',
                         dest='config',
                         help='YAML file with list of stations to be harvested or excluded from collecting')
@@ -524,6 +452,14 @@ if __name__ == '__main__':
                         action='store',
                         dest="service",
                         help='FIWARE Service')
+    parser.add_argument('--spool',
+                        action='store',
+                        dest='spool',
+                        help='Folder of the spool of the batches not accepted by Orion, sent again later')
+    parser.add_argument('--spool-size',
+                        default=default_spool_size,
+                        dest='spool_size',
+                        help='Limit the size of the spool (MB), beyond it the oldest batches are dropped')
     parser.add_argument('--stations',
                         action='store',
                         default=default_station_file,
@@ -534,6 +470,15 @@ if __name__ == '__main__':
                         default=default_timeout,
                         dest='timeout',
                         help='Run as a service')
+    parser.add_argument('--validate',
+                        const=default_tools,
+                        dest='validate',
+                        help='Validate the entities against the Data Model schemas (tools folder of the repository)',
+                        nargs='?')
+    parser.add_argument('--validation-budget',
+                        default=default_validation_budget,
+                        dest='validation_budget',
+                        help='Validation cost budget in milliseconds per entity (beyond it 1 out of N is validated)')
 
     args = parser.parse_args()
 
@@ -550,7 +495,22 @@ if __name__ == '__main__':
 
     logger, logger_req = setup_logger()
 
+    if args.validate:
+        python_path.insert(0, args.validate)
+        from harvest_validation import setup_validation, validate_entities, validation_report
+        setup_validation(['WeatherObserved'], float(args.validation_budget) / 1000)
+
+    python_path.append(default_tools)
+    from orion_writer import setup_writer, post, close_writer, writer_report, delivered
+    setup_writer(orion, service, path, limit_entities, limit_target, spool=args.spool,
+                 spool_bytes=int(args.spool_size) * 1024 * 1024)
+
+    if args.cache:
+        from change_cache import setup_cache, select_changed, commit_changes, cache_report
+        setup_cache(args.cache, [])
+
     set_event_loop_policy(EventLoopPolicy())
+    loop = new_event_loop()
 
     res = setup_stations_config(args.config)
     stations = setup_stations(res, args.station_file)
@@ -560,13 +520,24 @@ if __name__ == '__main__':
     while True:
         res = collect()
         if res:
-            res = run(prepare_schema(res))
-            run(post(res))
+            res = loop.run_until_complete(prepare_schema(res))
+            if args.cache:
+                res = select_changed(res)
+            if args.validate:
+                res = validate_entities(res, logger)
+                logger.info('Validation: %s', validation_report())
+            loop.run_until_complete(post(res))
+            logger.info('Orion: %s', writer_report())
+            if args.cache:
+                commit_changes(delivered)
+                logger.info('Cache: %s', cache_report())
         if timeout == -1:
             break
         else:
             logger.debug('Sleeping for the %s seconds', timeout)
-            sleep(timeout)
+            loop.run_until_complete(sleep(timeout))
+
+    loop.run_until_complete(close_writer())
 
     logger.info('Ended')
     exit(0)
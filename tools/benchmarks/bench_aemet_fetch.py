@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the collection of the Spanish weather forecasts (collect in
+specs/Weather/WeatherForecast/harvesters/spain/spain_weather_forecast.py), which
+takes two requests per municipality: the link to the data and the data.
+
+A local stand-in of the AEMET open data portal answers both requests after a fixed
+delay. The cycle time is measured for several values of the concurrency limits
+(--limit-source and --limit-datos of the harvester), together with the maximum
+amount of requests that the server had in progress at once and the speedup against
+the first value: the cycle time should go down in proportion to the concurrency.
+
+Usage: bench_aemet_fetch.py [-n municipalities] [--delay seconds] [-c concurrency ...]
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import sys
+import time
+import logging
+from argparse import ArgumentParser
+from asyncio import new_event_loop, sleep
+
+from aiohttp import web
+
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+harvester_folder = os.path.join(benchmarks_folder, '..', '..', 'specs', 'Weather', 'WeatherForecast', 'harvesters', 'spain')
+sys.path.insert(0, harvester_folder)
+
+import spain_weather_forecast as harvester  # noqa: E402
+
+PORT = 18026
+
+server = {
+    'delay': 0.05,
+    'in_progress': 0,
+    'max_in_progress': 0
+}
+
+
+def forecast():
+    days = [{'fecha': '2019-06-0{}T00:00:00'.format(day)} for day in [1, 2]]
+
+    return [{'elaborado': '2019-06-01', 'prediccion': {'dia': days}}]
+
+
+async def answer(data):
+    server['in_progress'] += 1
+    server['max_in_progress'] = max(server['max_in_progress'], server['in_progress'])
+
+    await sleep(server['delay'])
+
+    server['in_progress'] -= 1
+
+    return web.json_response(data)
+
+
+async def link(request):
+    url = 'http://127.0.0.1:{}/datos/{}'.format(PORT, request.match_info['station'])
+    return await answer({'descripcion': 'exito', 'estado': 200, 'datos': url})
+
+
+async def datos(request):
+    return await answer(forecast())
+
+
+async def start_server():
+    app = web.Application()
+    app.router.add_get('/api/{station}', link)
+    app.router.add_get('/datos/{station}', datos)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', PORT).start()
+
+    return runner
+
+
+def cycle(loop, limit_source, limit_datos):
+    harvester.limit_source = limit_source
+    harvester.limit_datos = limit_datos
+    server['max_in_progress'] = 0
+
+    start = time.perf_counter()
+    result = loop.run_until_complete(harvester.collect('key'))
+    elapsed = time.perf_counter() - start
+
+    if len(result) != len(harvester.stations):
+        raise ValueError('{} forecasts collected out of {}'.format(len(result), len(harvester.stations)))
+
+    return elapsed
+
+
+def main(args):
+    harvester.logger = logging.getLogger('root')
+    harvester.source_timeout = harvester.default_source_timeout
+    harvester.stations = {str(i): {'url': 'http://127.0.0.1:{}/api/{}'.format(PORT, i)} for i in range(args.n)}
+    server['delay'] = args.delay
+
+    loop = new_event_loop()
+    runner = loop.run_until_complete(start_server())
+
+    print('{} municipalities, 2 requests each, {:.0f} ms per request'.format(args.n, 1000 * args.delay))
+    print('{:>12} {:>12} {:>10} {:>18} {:>8}'.format('concurrency', 'cycle (s)', 'per sec', 'max in progress', 'speedup'))
+
+    base = None
+    for concurrency in args.c:
+        elapsed = cycle(loop, concurrency, concurrency)
+        if base is None:
+            base = elapsed
+        print('{:>12} {:>12.2f} {:>10.1f} {:>18} {:>8.1f}'.format(
+            concurrency, elapsed, args.n / elapsed, server['max_in_progress'], base / elapsed))
+
+    loop.run_until_complete(runner.cleanup())
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', type=int, default=200, help='number of municipalities')
+    parser.add_argument('--delay', type=float, default=0.05, help='delay of every answer of the server (seconds)')
+    parser.add_argument('-c', type=int, nargs='+', default=[1, 2, 5, 10, 20], help='concurrency limits to measure')
+
+    arguments = parser.parse_args()
+
+    main(arguments)
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the offline JSON-LD expansion / compaction (jsonld_offline).
+The inputs are the example-normalized-ld.jsonld files found under the specs folder.
+If pyld is installed its expansion (with the same local @context) is checked and timed too.
+
+Usage: bench_jsonld_offline.py [number of entities]
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+
+tools_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, tools_folder)
+
+from jsonld_offline import expand, compact, context_files  # noqa: E402
+from keyValues2Normalized import default_specs_folder  # noqa: E402
+
+try:
+    from pyld import jsonld
+except ImportError:
+    jsonld = None
+
+
+def read_examples(specs_folder):
+    out = []
+
+    for f in sorted(glob.glob(os.path.join(specs_folder, '**', 'example-normalized-ld.jsonld'), recursive=True)):
+        try:
+            with open(f) as data_file:
+                entity = json.load(data_file)
+        except ValueError:
+            continue
+        if isinstance(entity, dict) and 'id' in entity and '@context' in entity:
+            out.append(entity)
+
+    return out
+
+
+# pyld rejects the terms of the Data Models @context that look like IRIs (e.g. 'snow/ice')
+# or whose IRI has blanks (e.g. 'water dam'), they are removed as they are never properties
+def local_loader(url, options=None):
+    with open(context_files[url]) as data_file:
+        document = json.load(data_file)
+
+    document['@context'] = {t: d for t, d in document['@context'].items() if '/' not in t and ' ' not in t}
+
+    return {'contextUrl': None, 'documentUrl': url, 'document': document}
+
+
+def pyld_expand(entity):
+    try:
+        return jsonld.expand(entity)
+    except jsonld.JsonLdError:
+        return None
+
+
+def report(name, size, elapsed):
+    print('{:>24}: {:.3f}s ({:.0f} entities/sec)'.format(name, elapsed, size / elapsed))
+
+
+def main(args):
+    size = int(args[1]) if len(args) > 1 else 100000
+
+    examples = read_examples(default_specs_folder)
+    entities = [examples[i % len(examples)] for i in range(size)]
+
+    # Compacting an expanded entity and expanding it again must not change it
+    for entity in examples:
+        expanded = expand(entity)
+        if expand(compact(expanded, entity['@context'])) != expanded:
+            print('Round trip failed for ' + entity['id'])
+            exit(1)
+
+    start = time.perf_counter()
+    expanded = [expand(e) for e in entities]
+    report('expand', size, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for node, entity in zip(expanded, entities):
+        compact(node, entity['@context'])
+    report('compact', size, time.perf_counter() - start)
+
+    if jsonld is None:
+        return
+
+    jsonld.set_document_loader(local_loader)
+
+    checked = 0
+    for entity in examples:
+        reference = pyld_expand(entity)
+        if reference is None:
+            continue
+        if json.dumps(reference, sort_keys=True) != json.dumps([expand(entity)], sort_keys=True):
+            print('pyld gives a different expansion for ' + entity['id'])
+            exit(1)
+        checked += 1
+    print('{} of {} examples checked against pyld'.format(checked, len(examples)))
+
+    # pyld is much slower, so fewer entities are used
+    sample = entities[:max(1, size // 100)]
+    start = time.perf_counter()
+    for e in sample:
+        pyld_expand(e)
+    report('pyld expand', len(sample), time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
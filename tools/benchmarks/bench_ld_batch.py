@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Payload size of a batch of NGSI-LD entities converted by normalized2LD:
+@context inlined in every entity against a shared @context
+(Link header or a single {"@context", "@graph"} document).
+The inputs are the example-normalized.json files found under the specs folder.
+
+Usage: bench_ld_batch.py [batch size]
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import sys
+import glob
+import json
+
+tools_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, tools_folder)
+
+from keyValues2Normalized import default_specs_folder  # noqa: E402
+from normalized2LD import normalized_2_LD_stream, ld_batch_document, ld_context_link  # noqa: E402
+
+ld_context = 'https://schema.lab.fiware.org/ld/context'
+
+
+def read_examples(specs_folder):
+    out = []
+
+    for f in sorted(glob.glob(os.path.join(specs_folder, '**', 'example-normalized.json'), recursive=True)):
+        try:
+            with open(f) as data_file:
+                entity = json.load(data_file)
+        except ValueError:
+            continue
+        if isinstance(entity, dict) and 'id' in entity and 'type' in entity:
+            out.append(entity)
+
+    return out
+
+
+def report(name, size, reference):
+    print('{:>28}: {:>10} bytes ({:.1%})'.format(name, size, size / reference))
+
+
+def main(args):
+    size = int(args[1]) if len(args) > 1 else 1000
+
+    examples = read_examples(default_specs_folder)
+    entities = [examples[i % len(examples)] for i in range(size)]
+
+    inline = json.dumps(list(normalized_2_LD_stream(entities, ld_context)))
+    shared = json.dumps(list(normalized_2_LD_stream(entities, ld_context, inline_context=False)))
+    link = 'Link: ' + ld_context_link(ld_context)
+    graph = json.dumps(ld_batch_document(list(normalized_2_LD_stream(entities, ld_context, inline_context=False)), ld_context))
+
+    print('{} entities'.format(size))
+    report('@context in every entity', len(inline), len(inline))
+    report('shared @context (Link)', len(shared) + len(link), len(inline))
+    report('shared @context (@graph)', len(graph), len(inline))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the property extraction done by ldcontext_generator, traversing
+the schema with find_node for every lookup against indexing it once (schema_index).
+The time to build the index and the time of the lookups are reported separately.
+Synthetic schemas are generated with a growing number of properties and depth.
+
+Usage: bench_schema_index.py
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ldcontext_generator import extract_properties, extract_entity_type, extract_enumerations  # noqa: E402
+from schema_index import index_schema  # noqa: E402
+
+specs_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'specs')
+
+
+# A schema with size properties, each of them nested depth levels
+def synthetic_schema(size, depth):
+    properties = {
+        'type': {
+            'type': 'string',
+            'enum': ['Synthetic']
+        }
+    }
+
+    for i in range(size):
+        node = {
+            'type': 'string',
+            'format': 'date-time' if i % 3 == 0 else 'uri'
+        }
+        if i % 2 == 0:
+            node = {'type': 'string', 'enum': ['value{}'.format(i), 'other{}'.format(i)]}
+        for level in range(depth):
+            node = {'description': 'level {}'.format(level), 'anyOf': [{'type': 'null'}, node]}
+        properties['property{}'.format(i)] = node
+
+    return {
+        'allOf': [
+            {'$ref': 'https://fiware.github.io/data-models/common-schema.json#/definitions/GSMA-Commons'},
+            {'properties': properties}
+        ]
+    }
+
+
+def extract(schema, index):
+    return (extract_properties(schema, index),
+            extract_entity_type(schema, index),
+            extract_enumerations(schema, index))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    # Same results for every schema of the repository
+    for f in glob.glob(os.path.join(specs_folder, '**', 'schema.json'), recursive=True):
+        with open(f) as data_file:
+            schema = json.load(data_file)
+        if extract(schema, None) != extract(schema, index_schema(schema)):
+            print('Different results for ' + f)
+            exit(1)
+
+    # The index is built with a single walk, then every lookup is a dict access
+    print('{:>10} {:>6} {:>12} {:>12} {:>12} {:>8}'.format(
+        'properties', 'depth', 'find_node', 'index build', 'lookups', 'speedup'))
+
+    for size in [100, 1000, 5000]:
+        for depth in [1, 8, 32]:
+            schema = synthetic_schema(size, depth)
+            expected, find_node_time = timed(lambda: extract(schema, None))
+            index, build_time = timed(lambda: index_schema(schema))
+            result, lookup_time = timed(lambda: extract(schema, index))
+            if result != expected:
+                print('Different results for the synthetic schema')
+                exit(1)
+            print('{:>10} {:>6} {:>11.4f}s {:>11.4f}s {:>11.4f}s {:>7.2f}x'.format(
+                size, depth, find_node_time, build_time, lookup_time, find_node_time / (build_time + lookup_time)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark suite of the converters of the tools folder:
+normalized2LD.normalized_2_LD, keyValues2Normalized.keyValues_2_normalized,
+entity_print.print_json_string and ldcontext_generator.schema_2_ld_context.
+
+Every converter is run on the examples (or schemas) of the specs folder and on
+scaled up synthetic inputs (entities made by entity_generator, schemas as in
+bench_schema_index). For each case the throughput (best of several runs) and the
+allocations per item (memory blocks still allocated while the results are kept,
+and peak of the memory traced by tracemalloc) are written to a JSON results file.
+
+If a baseline (a results file saved before with --save-baseline) exists, the cases
+slower or allocating more than the baseline beyond the tolerances are reported
+as regressions, and the exit code is 1. The throughputs are compared relative to
+the speed of the machine at the moment, measured with a fixed calibration workload.
+
+Usage: bench_suite.py [-n synthetic entities] [-r runs] [-o results file]
+                      [-b baseline file] [--save-baseline]
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import gc
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import tracemalloc
+from datetime import datetime, timezone
+from argparse import ArgumentParser
+
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+tools_folder = os.path.join(benchmarks_folder, '..')
+sys.path.insert(0, tools_folder)
+
+from bench_schema_index import synthetic_schema  # noqa: E402
+from entity_generator import cached_model, generate_entities  # noqa: E402
+from entity_print import print_json_string  # noqa: E402
+from keyValues2Normalized import keyValues_2_normalized, default_specs_folder  # noqa: E402
+from ldcontext_generator import schema_2_ld_context  # noqa: E402
+from normalized2LD import normalized_2_LD  # noqa: E402
+from schema_resolver import schema_base  # noqa: E402
+from schema_types import attribute_types, schema_index  # noqa: E402
+
+ld_context = 'https://schema.lab.fiware.org/ld/context'
+uri_prefix = 'https://uri.fiware.org/ns/data-models'
+
+default_results_file = os.path.join(benchmarks_folder, 'results.json')
+default_baseline_file = os.path.join(benchmarks_folder, 'baseline.json')
+
+# Entity types of the synthetic entities
+synthetic_types = ['WeatherObserved', 'AirQualityObserved', 'Streetlight', 'OffStreetParking', 'Building']
+
+MIN_RUN_SECONDS = 0.2
+
+# Allowed relative differences against the baseline
+DEFAULT_THROUGHPUT_TOLERANCE = 0.25
+DEFAULT_ALLOCATION_TOLERANCE = 0.05
+
+
+def read_json(infile):
+    with open(infile) as data_file:
+        data = json.loads(data_file.read())
+
+    return data
+
+
+def read_examples(pattern):
+    out = []
+
+    for f in sorted(glob.glob(os.path.join(default_specs_folder, '**', pattern), recursive=True)):
+        try:
+            entity = read_json(f)
+        except ValueError:
+            continue
+        if isinstance(entity, dict) and 'id' in entity and 'type' in entity:
+            out.append(entity)
+
+    return out
+
+
+def read_schemas():
+    out = []
+
+    for f in sorted(glob.glob(os.path.join(default_specs_folder, '**', 'schema.json'), recursive=True)):
+        schema = read_json(f)
+        out.append((schema, schema_base(schema, f)))
+
+    return out
+
+
+def synthetic_entities(count):
+    schemas = schema_index(default_specs_folder)
+    models = [cached_model(schemas[t]) for t in synthetic_types]
+
+    return list(generate_entities(models, count, seed=1, check=False))
+
+
+# The converters, each one taking a single item
+def to_normalized(entity):
+    return keyValues_2_normalized(entity, attribute_types(entity['type'], default_specs_folder))
+
+
+def to_LD(entity):
+    return normalized_2_LD(entity, ld_context)
+
+
+def to_ld_context(schema_and_base):
+    schema, base = schema_and_base
+    return schema_2_ld_context(schema, uri_prefix, {}, base)
+
+
+# (case name, converter, items)
+def benchmark_cases(size):
+    key_values = read_examples('example.json')
+    normalized = read_examples('example-normalized.json')
+    ld = read_examples('example-normalized-ld.jsonld')
+
+    synthetic = synthetic_entities(size)
+    synthetic_normalized = [to_normalized(e) for e in synthetic]
+    synthetic_ld = [to_LD(e) for e in synthetic_normalized]
+
+    return [
+        ('keyValues_2_normalized/examples', to_normalized, key_values),
+        ('keyValues_2_normalized/synthetic', to_normalized, synthetic),
+        ('normalized_2_LD/examples', to_LD, normalized),
+        ('normalized_2_LD/synthetic', to_LD, synthetic_normalized),
+        ('print_json_string/examples', print_json_string, ld),
+        ('print_json_string/synthetic', print_json_string, synthetic_ld),
+        ('schema_2_ld_context/schemas', to_ld_context, read_schemas()),
+        ('schema_2_ld_context/synthetic', to_ld_context,
+         [(synthetic_schema(size // 10, depth), None) for depth in [1, 8, 32]])
+    ]
+
+
+# Best throughput (items/sec) of several runs. Each run goes through the items
+# as many times as needed to last MIN_RUN_SECONDS, so that small cases are not just noise
+def throughput(convert, items, runs):
+    best = 0
+
+    for _ in range(runs):
+        count = 0
+        start = time.perf_counter()
+        while True:
+            for item in items:
+                convert(item)
+            count += len(items)
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_RUN_SECONDS:
+                break
+        best = max(best, count / elapsed)
+
+    return best
+
+
+# Speed of the machine (runs/sec of a fixed workload similar to the converters)
+def calibration(runs):
+    entity = {'id': 'urn:ngsi-ld:Calibration:1', 'type': 'Calibration'}
+    entity.update({'attribute{}'.format(i): {'type': 'Number', 'value': i} for i in range(20)})
+
+    def workload(_):
+        return json.dumps({k: dict(v, metadata={}) if isinstance(v, dict) else v for k, v in entity.items()})
+
+    return throughput(workload, range(2000), runs)
+
+
+# Memory blocks allocated per item (kept alive by the results) and peak traced bytes per item
+def allocations(convert, items):
+    gc.collect()
+    gc.disable()
+
+    try:
+        tracemalloc.start()
+        blocks = sys.getallocatedblocks()
+
+        results = [convert(item) for item in items]
+
+        blocks = sys.getallocatedblocks() - blocks
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        gc.enable()
+
+    del results
+
+    return blocks / len(items), peak / len(items)
+
+
+def run_cases(cases, runs):
+    out = {}
+
+    for name, convert, items in cases:
+        # Warm up: caches of schema types, resolved $ref...
+        for item in items:
+            convert(item)
+
+        blocks, peak = allocations(convert, items)
+
+        out[name] = {
+            'items': len(items),
+            'items_per_sec': round(throughput(convert, items, runs), 1),
+            'blocks_per_item': round(blocks, 2),
+            'peak_bytes_per_item': round(peak, 1)
+        }
+
+    return out
+
+
+# Cases slower or allocating more than the baseline. The throughput of the baseline
+# is scaled by the ratio between the current speed of the machine and its own
+def find_regressions(results, baseline, throughput_tolerance, allocation_tolerance):
+    out = []
+
+    speed = results['calibration'] / baseline['calibration']
+
+    for name, result in results['cases'].items():
+        reference = baseline['cases'].get(name)
+        if reference is None or reference['items'] != result['items']:
+            continue
+
+        expected = reference['items_per_sec'] * speed
+        if result['items_per_sec'] < expected * (1 - throughput_tolerance):
+            out.append('{}: {:.0f} items/sec, {:.0f} expected from the baseline'.format(
+                name, result['items_per_sec'], expected))
+
+        for metric in ['blocks_per_item', 'peak_bytes_per_item']:
+            if result[metric] > reference[metric] * (1 + allocation_tolerance):
+                out.append('{}: {} {}, baseline {}'.format(name, result[metric], metric, reference[metric]))
+
+    return out
+
+
+def write_json(data, outfile):
+    with open(outfile, 'w') as data_file:
+        data_file.write(json.dumps(data, indent=4, sort_keys=True))
+        data_file.write("\n")
+
+
+def main(args):
+    cases = run_cases(benchmark_cases(args.n), args.r)
+    speed = calibration(args.r)
+
+    print('{:>36} {:>8} {:>14} {:>10} {:>12}'.format('case', 'items', 'items/sec', 'blocks', 'peak bytes'))
+    for name, result in cases.items():
+        print('{:>36} {:>8} {:>14.0f} {:>10.2f} {:>12.0f}'.format(
+            name, result['items'], result['items_per_sec'], result['blocks_per_item'], result['peak_bytes_per_item']))
+
+    results = {
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'synthetic_entities': args.n,
+        'calibration': round(speed, 1),
+        'cases': cases
+    }
+
+    write_json(results, args.o)
+
+    if args.save_baseline:
+        write_json(results, args.b)
+        print('Baseline saved to ' + args.b)
+        return
+
+    if not os.path.isfile(args.b):
+        print('No baseline found ({}), use --save-baseline to store one'.format(args.b))
+        return
+
+    regressions = find_regressions(results, read_json(args.b), args.throughput_tolerance, args.allocation_tolerance)
+    for regression in regressions:
+        print('Regression: ' + regression)
+
+    if len(regressions) > 0:
+        exit(1)
+
+    print('No regressions against ' + args.b)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', type=int, default=10000, help='number of synthetic entities')
+    parser.add_argument('-r', type=int, default=5, help='runs of each case (the best one is kept)')
+    parser.add_argument('-o', default=default_results_file, help='results file')
+    parser.add_argument('-b', default=default_baseline_file, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--throughput-tolerance', type=float, default=DEFAULT_THROUGHPUT_TOLERANCE)
+    parser.add_argument('--allocation-tolerance', type=float, default=DEFAULT_ALLOCATION_TOLERANCE)
+
+    arguments = parser.parse_args()
+
+    main(arguments)
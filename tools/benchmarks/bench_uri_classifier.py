@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Micro-benchmark of the URI classification done by normalized2LD
+(ld_id / ld_object), comparing the cached classifier against
+the previous rfc3987.parse based check
+
+Usage: bench_uri_classifier.py [number of ids]
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rfc3987 import parse  # noqa: E402
+from normalized2LD import is_ld_uri  # noqa: E402
+
+
+# The check previously done by ld_id and ld_object
+def is_ld_uri_parse(value):
+    try:
+        d = parse(value, rule='URI')
+        scheme = d['scheme']
+        if scheme != 'urn' and scheme != 'http' and scheme != 'https':
+            raise ValueError
+    except ValueError:
+        return False
+
+    return True
+
+
+# Mix of plain ids, NGSI-LD URNs, URLs and edge cases, with the repetition
+# found in real datasets (a few thousand distinct relationship targets)
+def sample_ids(size):
+    rnd = random.Random(1)
+    distinct = []
+    for i in range(5000):
+        distinct.append(rnd.choice([
+            'device-{:06d}'.format(i),
+            'urn:ngsi-ld:Device:device-{:06d}'.format(i),
+            'https://example.org/devices/{}'.format(i),
+            'http://example.org/devices/{}?q=1#f'.format(i),
+            'ftp://example.org/{}'.format(i),
+            'URN:ngsi-ld:Device:{}'.format(i),
+            'urn:bad id {}'.format(i),
+            'http:{}'.format(i),
+        ]))
+
+    return [rnd.choice(distinct) for _ in range(size)]
+
+
+def main(args):
+    size = int(args[1]) if len(args) > 1 else 200000
+    ids = sample_ids(size)
+
+    for value in set(ids):
+        if is_ld_uri(value) != is_ld_uri_parse(value):
+            print('Classification mismatch: ' + value)
+            exit(1)
+
+    is_ld_uri.cache_clear()
+
+    for name, func in [('rfc3987.parse', is_ld_uri_parse), ('is_ld_uri', is_ld_uri)]:
+        elapsed = timeit.timeit(lambda: [func(value) for value in ids], number=1)
+        print('{:>14}: {:.3f}s ({:.0f} ids/sec)'.format(name, elapsed, size / elapsed))
+
+    print(is_ld_uri.cache_info())
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,237 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Regenerates the normalized and LD examples of every Data Model found in a folder:
+ - example.json -> example-normalized.json (keyValues2Normalized)
+ - example-normalized.json -> example-normalized-ld.jsonld (normalized2LD)
+and the same for the other examples (example-1.json -> example-1-normalized.json
+-> example-1-normalized-ld.jsonld...).
+
+An example is written only if it does not exist or if it was written by this tool
+before (it is in the cache), so the examples written by hand, with their metadata,
+are kept as they are. To have one of them generated, remove it.
+
+Models are converted in parallel. A file is skipped if the hashes of its inputs
+(source example, schema.json, LD @context and version of the tools, which includes
+the common schemas followed by the $ref) are the same as in the last run, which are
+kept in a cache file.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from glob import glob
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+from keyValues2Normalized import keyValues_2_normalized
+from normalized2LD import normalized_2_LD
+from schema_resolver import base_folder
+from schema_types import compile_schema
+from entity_print import write_json_string
+
+tools_folder = os.path.dirname(os.path.abspath(__file__))
+
+# Any change in these files changes the tools version
+tools_files = ['build_examples.py', 'entity_print.py', 'keyValues2Normalized.py',
+               'normalized2LD.py', 'schema_resolver.py', 'schema_types.py']
+
+default_cache_file = os.path.join(tools_folder, 'build_examples.cache.json')
+default_folder = os.path.join(tools_folder, '..', 'specs')
+default_ld_context = 'https://schema.lab.fiware.org/ld/context'
+
+SCHEMA_FILE = 'schema.json'
+
+# example.json, example-1.json, example-agriAlert.json... (not the generated ones)
+KEYVALUES_PATTERN = re.compile(r'^example(-(?!.*normalized)[^.]+)?\.json$')
+NORMALIZED_PATTERN = re.compile(r'^example(-[^.]+)?-normalized\.json$')
+
+
+def read_json(infile):
+    with open(infile) as data_file:
+        data = json.loads(data_file.read())
+
+    return data
+
+
+def write_json(data, outfile):
+    with open(outfile, 'w') as data_file:
+        write_json_string(data, data_file)
+        data_file.write("\n")
+
+
+def file_hash(path):
+    with open(path, 'rb') as data_file:
+        return hashlib.sha1(data_file.read()).hexdigest()
+
+
+# The documents referenced by the schemas
+def common_schemas():
+    return sorted(glob(os.path.join(base_folder, '*-schema.json')) +
+                  glob(os.path.join(base_folder, 'specs', '*', '*-schema.json')))
+
+
+# Version of the tools: these scripts and the common schemas
+def tools_version():
+    digest = hashlib.sha1()
+
+    for f in tools_files:
+        digest.update(file_hash(os.path.join(tools_folder, f)).encode())
+    for f in common_schemas():
+        digest.update(file_hash(f).encode())
+
+    return digest.hexdigest()
+
+
+# Key of an output file: hash of everything the output depends on
+def build_key(*parts):
+    return hashlib.sha1('/'.join(parts).encode()).hexdigest()
+
+
+# Examples of a model: (keyValues example or None, normalized example, LD example)
+def find_examples(model_folder):
+    out = []
+
+    files = sorted(os.listdir(model_folder))
+    normalized = set(f for f in files if NORMALIZED_PATTERN.match(f))
+
+    for f in files:
+        if KEYVALUES_PATTERN.match(f):
+            name = f[:-len('.json')] + '-normalized.json'
+            normalized.discard(name)
+            out.append((f, name))
+    out.extend((None, f) for f in sorted(normalized))
+
+    return [(os.path.join(model_folder, k) if k else None, os.path.join(model_folder, n),
+             os.path.join(model_folder, n[:-len('.json')] + '-ld.jsonld')) for k, n in out]
+
+
+# Finds the folders with examples to be converted
+def find_models(folder):
+    out = []
+
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        if len(find_examples(dirpath)) > 0:
+            out.append(dirpath)
+
+    return out
+
+
+# An example is (re)generated if it does not exist or it was generated before
+def owns_example(target_file, cache):
+    return target_file in cache or not os.path.isfile(target_file)
+
+
+def normalized_key(keyvalues_file, schema_file, version):
+    schema_hash = file_hash(schema_file) if os.path.isfile(schema_file) else ''
+    return build_key(version, file_hash(keyvalues_file), schema_hash)
+
+
+# Converts the examples of a model. Runs in a worker process.
+# Returns the list of (output file, key) generated
+def build_model(model_folder, cache, ld_context, version):
+    out = []
+
+    schema_file = os.path.join(model_folder, SCHEMA_FILE)
+    attr_types = None
+
+    for keyvalues_file, normalized_file, ld_file in find_examples(model_folder):
+        if keyvalues_file is not None and owns_example(normalized_file, cache):
+            key = normalized_key(keyvalues_file, schema_file, version)
+
+            if cache.get(normalized_file) != key or not os.path.isfile(normalized_file):
+                if attr_types is None and os.path.isfile(schema_file):
+                    attr_types = compile_schema(schema_file)
+                write_json(keyValues_2_normalized(read_json(keyvalues_file), attr_types), normalized_file)
+                out.append((normalized_file, key))
+
+        # The LD example is derived from the normalized one, so it is checked afterwards
+        if os.path.isfile(normalized_file) and owns_example(ld_file, cache):
+            key = build_key(version, file_hash(normalized_file), ld_context)
+
+            if cache.get(ld_file) != key or not os.path.isfile(ld_file):
+                write_json(normalized_2_LD(read_json(normalized_file), ld_context), ld_file)
+                out.append((ld_file, key))
+
+    return out
+
+
+# Checks, without converting anything, if the examples of a model are up to date
+def is_up_to_date(model_folder, cache, ld_context, version):
+    schema_file = os.path.join(model_folder, SCHEMA_FILE)
+
+    for keyvalues_file, normalized_file, ld_file in find_examples(model_folder):
+        if keyvalues_file is not None and owns_example(normalized_file, cache):
+            if cache.get(normalized_file) != normalized_key(keyvalues_file, schema_file, version):
+                return False
+
+        if not os.path.isfile(normalized_file) or not owns_example(ld_file, cache):
+            continue
+
+        if cache.get(ld_file) != build_key(version, file_hash(normalized_file), ld_context) or not os.path.isfile(ld_file):
+            return False
+
+    return True
+
+
+def build(folder, ld_context, cache_file, workers, force):
+    cache = dict()
+    if os.path.isfile(cache_file):
+        cache = read_json(cache_file)
+
+    # The files generated before are still known, so that they are generated again
+    if force:
+        cache = {f: None for f in cache}
+
+    version = tools_version()
+
+    models = [m for m in find_models(folder) if not is_up_to_date(m, cache, ld_context, version)]
+
+    generated = []
+    if len(models) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(build_model, m, cache, ld_context, version) for m in models]
+            for future in futures:
+                generated.extend(future.result())
+
+    for f, key in generated:
+        cache[f] = key
+
+    with open(cache_file, 'w') as data_file:
+        data_file.write(json.dumps(cache, indent=4, sort_keys=True))
+        data_file.write("\n")
+
+    return models, generated
+
+
+def main(args):
+    start = time.perf_counter()
+
+    models, generated = build(os.path.abspath(args.f), args.u, args.cache, args.j, args.force)
+
+    for f, _ in generated:
+        print(f)
+
+    print('{} models rebuilt, {} files written in {:.2f}s'.format(
+        len(models), len(generated), time.perf_counter() - start))
+
+
+# Entry point
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-f', default=default_folder, help='folder (default: the specs folder)')
+    parser.add_argument('-u', default=default_ld_context, help='target LD @context')
+    parser.add_argument('-j', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--cache', default=default_cache_file, help='cache file')
+    parser.add_argument('--force', action='store_true', help='rebuild everything')
+
+    arguments = parser.parse_args()
+
+    main(arguments)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+
+Change detection of the entities sent by the harvesters in service mode (--timeout).
+The hash of the content of every entity sent to Orion, leaving out the volatile
+attributes (dateRetrieved...), is kept by entity id, and in the next cycles only the
+new or changed entities are sent.
+
+A hash is kept only once Orion has accepted the entity (see delivered in orion_writer),
+so an entity which was not sent is tried again in the next cycle. The cache is saved
+to a JSON file after every cycle (a temporary file renamed over the previous one), so
+a restart does not send all the entities again.
+
+The ids of some entities change over time (they include the date of the forecast or
+of the observation), so the ids which were not seen in the last max_cycles cycles are
+dropped from the cache.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import json
+import time
+import hashlib
+
+DEFAULT_VOLATILE = ['dateRetrieved']
+
+# Cycles an id is kept in the cache after it was last seen
+DEFAULT_MAX_CYCLES = 24
+
+settings = {
+    'file': None,
+    'volatile': DEFAULT_VOLATILE,
+    'max_cycles': DEFAULT_MAX_CYCLES
+}
+
+# Number of the current cycle, kept in the cache file
+current = {
+    'cycle': 0
+}
+
+# Entity id -> [hash of the last content accepted by Orion, last cycle the id was seen]
+hashes = {
+}
+
+# Entity id -> (hash, time) of the entities selected in the current cycle
+pending = {
+}
+
+stats = {
+    'entities': 0,
+    'unchanged': 0,
+    'new': 0,
+    'changed': 0,
+    'cycle_entities': 0,
+    'cycle_unchanged': 0,
+    'evicted': 0
+}
+
+
+def setup_cache(cache_file, volatile=DEFAULT_VOLATILE, max_cycles=DEFAULT_MAX_CYCLES):
+    settings['file'] = cache_file
+    settings['volatile'] = volatile
+    settings['max_cycles'] = max_cycles
+
+    hashes.clear()
+    current['cycle'] = 0
+    try:
+        with open(cache_file) as data_file:
+            data = json.loads(data_file.read())
+    except FileNotFoundError:
+        return
+
+    current['cycle'] = data['cycle']
+    hashes.update(data['entities'])
+
+
+def entity_hash(entity):
+    content = {k: v for k, v in entity.items() if k not in settings['volatile']}
+
+    return hashlib.blake2b(json.dumps(content, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Returns the entities which are new or changed since they were accepted by Orion
+def select_changed(entities):
+    out = []
+
+    pending.clear()
+    now = time.time()
+
+    current['cycle'] += 1
+
+    stats['cycle_entities'] = len(entities)
+    stats['cycle_unchanged'] = 0
+
+    for entity in entities:
+        stats['entities'] += 1
+
+        value = entity_hash(entity)
+        previous = hashes.get(entity['id'])
+
+        if previous is not None:
+            previous[1] = current['cycle']
+            previous = previous[0]
+
+        if previous == value:
+            stats['unchanged'] += 1
+            stats['cycle_unchanged'] += 1
+            continue
+
+        stats['new' if previous is None else 'changed'] += 1
+        pending[entity['id']] = (value, now)
+        out.append(entity)
+
+    return out
+
+
+# Keeps the hashes of the selected entities accepted by Orion since they were selected
+# (delivered: entity id -> time of the last update accepted), drops the ids not seen
+# in the last max_cycles cycles and saves the cache
+def commit_changes(delivered):
+    for entity_id, (value, selected) in pending.items():
+        if delivered.get(entity_id, 0) >= selected:
+            hashes[entity_id] = [value, current['cycle']]
+
+    pending.clear()
+
+    evict_unseen()
+    save_cache()
+
+
+def evict_unseen():
+    unseen = [entity_id for entity_id, (value, cycle) in hashes.items()
+              if current['cycle'] - cycle > settings['max_cycles']]
+
+    for entity_id in unseen:
+        del hashes[entity_id]
+
+    stats['evicted'] += len(unseen)
+
+
+def save_cache():
+    temporary = settings['file'] + '.tmp'
+
+    with open(temporary, 'w') as data_file:
+        data_file.write(json.dumps({'cycle': current['cycle'], 'entities': hashes}))
+
+    os.replace(temporary, settings['file'])
+
+
+def cache_metrics():
+    return {
+        'entities': stats['entities'],
+        'unchanged': stats['unchanged'],
+        'new': stats['new'],
+        'changed': stats['changed'],
+        'hit_rate': stats['unchanged'] / stats['entities'] if stats['entities'] else 0,
+        'cycle_hit_rate': stats['cycle_unchanged'] / stats['cycle_entities'] if stats['cycle_entities'] else 0,
+        'cached': len(hashes),
+        'evicted': stats['evicted']
+    }
+
+
+def cache_report():
+    return '{entities} entities, {unchanged} unchanged and not sent ({hit_rate:.1%}, {cycle_hit_rate:.1%} ' \
+           'in the last cycle), {new} new, {changed} changed, {cached} entities in the cache, ' \
+           '{evicted} evicted'.format(**cache_metrics())
@@ -0,0 +1,761 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Generates synthetic NGSI entities from the schema.json of one or more Data Models,
+for load testing. Values follow the schemas: enumerations, formats (date-time, uri...),
+ranges, geo:json locations and relationships (URNs of entities of the referenced type).
+
+The output is NDJSON, in the keyValues, normalized or NGSI-LD representation.
+A seeded random number generator is used, so the same arguments give the same entities.
+Each entity is checked against its schema (see harvest_validation) and generated
+again when it is not valid (up to MAX_ATTEMPTS times).
+
+Entities are generated in chunks by a pool of processes, the output is the same
+whatever the number of workers.
+
+Usage: entity_generator.py -t WeatherObserved [-t ...] [-n count] [--seed seed] [-j workers]
+                           [--format keyValues|normalized|LD] [-o output file|-]
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+from __future__ import print_function
+
+import io
+import os
+import sys
+import time
+import random
+import string
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from argparse import ArgumentParser
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+import fastjsonschema
+
+from entity_stream import open_stream, write_entities, print_stats
+from harvest_validation import compile_validator, validate_entity
+from keyValues2LD import keyValues_2_LD
+from keyValues2Normalized import keyValues_2_normalized, default_specs_folder
+from schema_resolver import read_json, schema_base, self_contained
+from schema_types import MAX_DEPTH, compile_schema, schema_index
+
+MAX_ATTEMPTS = 10
+
+# Entities generated by a worker at once
+CHUNK_SIZE = 5000
+
+# Attributes are cheaper to generate again than whole entities
+MAX_ATTRIBUTE_ATTEMPTS = 100
+
+# Probability of generating a property which is not required
+OPTIONAL_PROBABILITY = 0.9
+
+# Dates are generated in this period
+FIRST_DATE = datetime(2016, 1, 1, tzinfo=timezone.utc)
+DATE_RANGE = 4 * 365 * 24 * 3600
+
+# Locations are generated in this box (lon, lat), roughly Europe
+LOCATION_BOX = ((-10.0, 36.0), (30.0, 60.0))
+
+default_ld_context = 'https://schema.lab.fiware.org/ld/context'
+
+words = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliett',
+         'kilo', 'lima', 'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango']
+
+
+# Everything needed to generate the entities of a type, prepared only once
+def compile_model(schema_file):
+    schema = read_json(schema_file)
+    schema = self_contained(schema, schema_base(schema, schema_file))
+
+    properties = {}
+    required = set()
+    choices = []
+    collect_object(schema, properties, required, choices)
+
+    # Some schemas require properties which they do not describe
+    for p in required:
+        properties.setdefault(p, {})
+
+    attr_types = compile_schema(schema_file)
+
+    return {
+        'type': entity_type(properties['type']),
+        'properties': properties,
+        'required': required,
+        'choices': choices,
+        'attr_types': attr_types,
+        'geometry_types': {p: sorted(geometry_types(node) or ['Point'])
+                           for p, node in properties.items() if attr_types.get(p) == 'geo:json'},
+        'validators': {p: compile_property(node) for p, node in properties.items()},
+        'validator': compile_validator(schema_file)
+    }
+
+
+# The type property is described by an enum, sometimes inside an allOf
+def entity_type(node):
+    if isinstance(node.get('enum'), list):
+        return node['enum'][0]
+
+    return next(entity_type(n) for n in node.get('allOf', []) if 'enum' in n or 'allOf' in n)
+
+
+# Attributes are checked one by one, so that only the wrong ones are generated again
+def compile_property(node):
+    try:
+        validator = fastjsonschema.compile(node)
+    except Exception:
+        return None
+
+    def is_valid(value):
+        try:
+            validator(value)
+        except fastjsonschema.JsonSchemaValueException:
+            return False
+        return True
+
+    return is_valid
+
+
+# Merges the properties (and required ones) of an object node and its allOf / anyOf / oneOf.
+# A property described several times must match all the descriptions. anyOf / oneOf which
+# only list required properties (e.g. location or address) are added to choices
+def collect_object(node, properties, required, choices=None, depth=0):
+    if not isinstance(node, dict) or depth > MAX_DEPTH:
+        return
+
+    for key in ['allOf', 'anyOf', 'oneOf']:
+        if not isinstance(node.get(key), list):
+            continue
+
+        if key != 'allOf' and all(is_required_only(n) for n in node[key]):
+            if choices is not None:
+                choices.append((key, [set(n['required']) for n in node[key]]))
+            continue
+
+        for sub_node in node[key]:
+            # Only allOf members (or the node itself) make a property required
+            collect_object(sub_node, properties, required if key == 'allOf' else set(), choices, depth + 1)
+
+    if isinstance(node.get('properties'), dict):
+        for p, p_node in node['properties'].items():
+            properties[p] = {'allOf': [properties[p], p_node]} if p in properties else p_node
+
+    if isinstance(node.get('required'), list):
+        required.update(node['required'])
+
+
+def is_required_only(node):
+    return isinstance(node, dict) and isinstance(node.get('required'), list) and \
+        len(set(node) - {'required', 'description'}) == 0
+
+
+def random_date(rng):
+    return FIRST_DATE + timedelta(seconds=rng.randrange(DATE_RANGE))
+
+
+def random_word(rng):
+    return words[rng.randrange(len(words))]
+
+
+def random_position(rng):
+    (min_lon, min_lat), (max_lon, max_lat) = LOCATION_BOX
+
+    return [round(rng.uniform(min_lon, max_lon), 6), round(rng.uniform(min_lat, max_lat), 6)]
+
+
+def random_line(rng):
+    return [random_position(rng) for _ in range(rng.randint(2, 4))]
+
+
+def random_ring(rng):
+    ring = [random_position(rng) for _ in range(3)]
+
+    return ring + [ring[0]]
+
+
+geometries = {
+    'Point': random_position,
+    'LineString': random_line,
+    'Polygon': lambda rng: [random_ring(rng)],
+    'MultiPoint': random_line,
+    'MultiLineString': lambda rng: [random_line(rng) for _ in range(rng.randint(1, 3))],
+    'MultiPolygon': lambda rng: [[random_ring(rng)] for _ in range(rng.randint(1, 3))]
+}
+
+
+# GeoJSON geometry types allowed by a geo:json node (the enum of their type property),
+# None if any geometry is allowed
+def geometry_types(node, depth=0):
+    if not isinstance(node, dict) or depth > MAX_DEPTH:
+        return None
+
+    out = None
+
+    type_node = node.get('properties', {}).get('type', {})
+    if isinstance(type_node, dict) and isinstance(type_node.get('enum'), list):
+        out = set(t for t in type_node['enum'] if t in geometries)
+
+    # Any alternative can be taken, but all the allOf members must be matched
+    for key in ['anyOf', 'oneOf']:
+        if isinstance(node.get(key), list):
+            alternatives = [geometry_types(n, depth + 1) for n in node[key]]
+            if None not in alternatives:
+                out = intersection(out, set().union(*alternatives))
+
+    for sub_node in node.get('allOf', []):
+        out = intersection(out, geometry_types(sub_node, depth + 1))
+
+    return out
+
+
+def intersection(a, b):
+    if a is None or b is None:
+        return b if a is None else a
+
+    return a & b
+
+
+# Points when allowed (the most usual location of the entities), otherwise any allowed geometry
+def random_geometry(rng, types):
+    geometry_type = 'Point' if 'Point' in types else types[rng.randrange(len(types))]
+
+    return {
+        'type': geometry_type,
+        'coordinates': geometries[geometry_type](rng)
+    }
+
+
+# Entity type referenced by a relationship attribute (refDevice -> Device, hasAgriSoil -> AgriSoil)
+def relationship_type(name):
+    for prefix in ['ref', 'has']:
+        if name.startswith(prefix) and len(name) > len(prefix) and name[len(prefix)].isupper():
+            return name[len(prefix):]
+
+    return None
+
+
+def relationship_object(rng, name):
+    return 'urn:ngsi-ld:{}:{:08x}'.format(relationship_type(name) or 'Thing', rng.getrandbits(32))
+
+
+def relationship_id(rng, name):
+    return '{}-{:08x}'.format(relationship_type(name) or 'Thing', rng.getrandbits(32))
+
+
+# Characters used to fill the character classes of the patterns
+pattern_alphabet = string.ascii_letters + string.digits + '-_.:/'
+
+# Character classes given by escapes (\d...). As for Python (the validators), a POSIX
+# class ([[:xdigit:]]) is a set of characters followed by a ']'
+escape_classes = {
+    'd': lambda c: c.isdigit(),
+    'D': lambda c: not c.isdigit(),
+    'w': lambda c: c.isalnum() or c == '_',
+    'W': lambda c: not (c.isalnum() or c == '_'),
+    's': lambda c: c.isspace(),
+    'S': lambda c: not c.isspace()
+}
+
+LOOKAROUNDS = ('(?=', '(?!', '(?<=', '(?<!')
+
+
+# Parses the subset of the regular expressions used by the schemas into a list of
+# alternatives, each one a list of items:
+#  ('literal', character), ('any',), ('in', allowed characters),
+#  ('group', alternatives), ('repeat', minimum, maximum or None, item)
+# Anchors and assertions (lookaheads...) are left out: the strings which do not
+# match them are rejected by the checks. Parsed only once per pattern
+@lru_cache(maxsize=None)
+def parse_pattern(pattern):
+    return parse_alternatives(pattern, 0)[0]
+
+
+def parse_alternatives(pattern, i):
+    alternatives = [[]]
+
+    while i < len(pattern) and pattern[i] != ')':
+        if pattern[i] == '|':
+            alternatives.append([])
+            i += 1
+            continue
+
+        item, i = parse_atom(pattern, i)
+        item, i = parse_quantifier(pattern, i, item)
+        if item is not None:
+            alternatives[-1].append(item)
+
+    return alternatives, i
+
+
+def parse_atom(pattern, i):
+    c = pattern[i]
+
+    if c == '(':
+        lookaround = next((prefix for prefix in LOOKAROUNDS if pattern.startswith(prefix, i)), None)
+        if lookaround is not None:
+            i += len(lookaround)
+        elif pattern.startswith('(?:', i):
+            i += 3
+        else:
+            i += 1
+        alternatives, i = parse_alternatives(pattern, i)
+        return None if lookaround else ('group', alternatives), i + 1
+
+    if c == '[':
+        return parse_class(pattern, i + 1)
+
+    if c == '\\':
+        e = pattern[i + 1]
+        if e in escape_classes:
+            return ('in', [a for a in pattern_alphabet if escape_classes[e](a)]), i + 2
+        if e in 'bBAZ':
+            return None, i + 2
+        return ('literal', e), i + 2
+
+    if c in '^$':
+        return None, i + 1
+
+    if c == '.':
+        return ('any',), i + 1
+
+    return ('literal', c), i + 1
+
+
+# A character class, the characters of the alphabet it matches (or its own literals)
+def parse_class(pattern, i):
+    negate = pattern[i] == '^'
+    if negate:
+        i += 1
+
+    literals = []
+    tests = []
+
+    first = True
+    while i < len(pattern) and (pattern[i] != ']' or first):
+        first = False
+        c = pattern[i]
+
+        if c == '\\':
+            c = pattern[i + 1]
+            i += 2
+            if c in escape_classes:
+                tests.append(escape_classes[c])
+                continue
+        else:
+            i += 1
+
+        if pattern[i:i + 1] == '-' and pattern[i + 1:i + 2] not in ['', ']']:
+            last = pattern[i + 1]
+            i += 2
+            if last == '\\':
+                last = pattern[i]
+                i += 1
+            tests.append(lambda x, first_c=c, last_c=last: first_c <= x <= last_c)
+        else:
+            literals.append(c)
+
+    def matches(x):
+        return x in literals or any(test(x) for test in tests)
+
+    allowed = [c for c in pattern_alphabet if matches(c) != negate]
+    if not allowed and not negate:
+        allowed = literals
+
+    return ('in', allowed), i + 1
+
+
+def parse_quantifier(pattern, i, item):
+    c = pattern[i:i + 1]
+
+    if c in ['?', '*', '+']:
+        minimum, maximum = {'?': (0, 1), '*': (0, None), '+': (1, None)}[c]
+        i += 1
+    elif c == '{' and '}' in pattern[i:]:
+        end = pattern.index('}', i)
+        bounds = pattern[i + 1:end].split(',')
+        if not all(b.strip().isdigit() or (b == '' and n > 0) for n, b in enumerate(bounds)) or len(bounds) > 2:
+            return item, i
+        minimum = int(bounds[0])
+        maximum = minimum if len(bounds) == 1 else int(bounds[1]) if bounds[1] else None
+        i = end + 1
+    else:
+        return item, i
+
+    # Lazy and possessive quantifiers generate the same strings
+    if pattern[i:i + 1] in ['?', '+']:
+        i += 1
+
+    if item is None:
+        return None, i
+
+    return ('repeat', minimum, maximum, item), i
+
+
+# Generates a string matching one of the alternatives of a parsed regular expression
+def generate_pattern(rng, alternatives):
+    return ''.join(generate_item(rng, item) for item in alternatives[rng.randrange(len(alternatives))])
+
+
+def generate_item(rng, item):
+    kind = item[0]
+
+    if kind == 'literal':
+        return item[1]
+
+    if kind == 'any':
+        return rng.choice(string.ascii_letters)
+
+    if kind == 'in':
+        return rng.choice(item[1] or pattern_alphabet)
+
+    if kind == 'group':
+        return generate_pattern(rng, item[1])
+
+    minimum, maximum, sub_item = item[1:]
+    count = rng.randint(minimum, minimum + 3 if maximum is None else min(maximum, minimum + 3))
+
+    return ''.join(generate_item(rng, sub_item) for _ in range(count))
+
+
+def generate_string(rng, node, name):
+    string_format = node.get('format')
+
+    if isinstance(node.get('pattern'), str):
+        return generate_pattern(rng, parse_pattern(node['pattern']))
+
+    if string_format == 'date-time':
+        return random_date(rng).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    if string_format == 'date':
+        return random_date(rng).strftime('%Y-%m-%d')
+
+    if string_format == 'time':
+        return random_date(rng).strftime('%H:%M:%S')
+
+    if string_format in ['uri', 'url']:
+        return 'https://example.org/{}/{}'.format(name, rng.randrange(100000))
+
+    if string_format == 'email':
+        return '{}@example.org'.format(random_word(rng))
+
+    value = '{} {}'.format(random_word(rng), rng.randrange(1000))
+
+    min_length = node.get('minLength', 0)
+    max_length = node.get('maxLength')
+    if len(value) < min_length:
+        value = value.ljust(min_length, 'x')
+    if max_length is not None:
+        value = value[:max_length]
+
+    return value
+
+
+def generate_number(rng, node, integer=False):
+    minimum = node.get('minimum', node.get('exclusiveMinimum', 0))
+    maximum = node.get('maximum', node.get('exclusiveMaximum', minimum + 100))
+
+    if maximum < minimum:
+        maximum = minimum
+
+    if integer:
+        return rng.randint(int(minimum) + (1 if 'exclusiveMinimum' in node else 0),
+                           int(maximum) - (1 if 'exclusiveMaximum' in node else 0))
+
+    value = round(rng.uniform(minimum, maximum), 2)
+    if ('exclusiveMinimum' in node and value <= minimum) or ('exclusiveMaximum' in node and value >= maximum):
+        value = (minimum + maximum) / 2
+
+    return value
+
+
+def generate_array(rng, node, name, depth):
+    items = node.get('items', {})
+
+    min_items = node.get('minItems', 1)
+
+    # Tuple validation, the last item describes the additional ones
+    if isinstance(items, list):
+        nodes = items + items[-1:] * (min_items - len(items)) if len(items) > 0 else [{}] * min_items
+        return [generate_value(rng, item, name, depth + 1) for item in nodes]
+
+    max_items = node.get('maxItems', min_items + 2)
+    size = rng.randint(min_items, max(min_items, max_items))
+
+    if isinstance(items, dict) and isinstance(items.get('enum'), list) and len(items['enum']) > 0:
+        return rng.sample(items['enum'], min(size, len(items['enum'])))
+
+    out = []
+    for _ in range(size):
+        value = generate_value(rng, items, name, depth + 1)
+        if not node.get('uniqueItems') or value not in out:
+            out.append(value)
+
+    return out
+
+
+def generate_object(rng, node, depth):
+    properties = {}
+    required = set()
+    collect_object(node, properties, required)
+
+    out = {}
+    for p in properties:
+        if p in required or rng.random() < OPTIONAL_PROBABILITY:
+            out[p] = generate_value(rng, properties[p], p, depth + 1)
+
+    return out
+
+
+# Generates a value valid (most of the times) for a schema node
+def generate_value(rng, node, name, depth=0):
+    if not isinstance(node, dict) or depth > MAX_DEPTH:
+        return None
+
+    if isinstance(node.get('enum'), list) and len(node['enum']) > 0:
+        return node['enum'][rng.randrange(len(node['enum']))]
+
+    if 'const' in node:
+        return node['const']
+
+    for key in ['oneOf', 'anyOf']:
+        if isinstance(node.get(key), list) and len(node[key]) > 0:
+            # Alternatives which only list required properties keep the node type
+            alternatives = [n for n in node[key] if isinstance(n, dict) and not is_required_only(n)]
+            if len(alternatives) > 0:
+                # The constraints of the node apply to the alternative as well
+                alternative = {k: v for k, v in node.items() if k != key}
+                alternative.update(alternatives[rng.randrange(len(alternatives))])
+                return generate_value(rng, alternative, name, depth + 1)
+
+    if isinstance(node.get('allOf'), list):
+        merged = {}
+        for sub_node in node['allOf']:
+            if isinstance(sub_node, dict):
+                merged.update(sub_node)
+        merged.update({k: v for k, v in node.items() if k != 'allOf'})
+        if merged.get('type', 'object') == 'object':
+            return generate_object(rng, node, depth)
+        return generate_value(rng, merged, name, depth + 1)
+
+    node_type = node.get('type')
+    if isinstance(node_type, list):
+        types = [t for t in node_type if t != 'null']
+        node_type = types[rng.randrange(len(types))] if types else 'null'
+
+    if node_type == 'string':
+        return generate_string(rng, node, name)
+
+    if node_type == 'number':
+        return generate_number(rng, node)
+
+    if node_type == 'integer':
+        return generate_number(rng, node, integer=True)
+
+    if node_type == 'boolean':
+        return rng.random() < 0.5
+
+    if node_type == 'array':
+        return generate_array(rng, node, name, depth)
+
+    if node_type == 'object' or 'properties' in node:
+        return generate_object(rng, node, depth)
+
+    return generate_string(rng, node, name)
+
+
+# The type of a node, sometimes given by a member of its allOf
+def schema_type(node, depth=0):
+    if not isinstance(node, dict) or depth > MAX_DEPTH:
+        return None
+
+    if 'type' in node:
+        return node['type']
+
+    return next((t for t in (schema_type(n, depth + 1) for n in node.get('allOf', [])) if t is not None), None)
+
+
+# Generates the value of an attribute. Relationships are URNs, but a few schemas accept
+# an URN by two alternatives of a oneOf, so plain identifiers are tried as well.
+# Attributes only named as relationships (refX, hasX) are generated from their schema
+# once the first half of the attempts has failed
+def generate_attribute(rng, model, p, attempt):
+    node = model['properties'][p]
+    attr_type = model['attr_types'].get(p)
+
+    if attr_type == 'geo:json':
+        return random_geometry(rng, model['geometry_types'][p])
+
+    if attr_type == 'Relationship' or (relationship_type(p) is not None and attempt < MAX_ATTRIBUTE_ATTEMPTS // 2):
+        make = relationship_object if attempt % 2 == 0 else relationship_id
+        if schema_type(node) == 'array':
+            return [make(rng, p) for _ in range(rng.randint(1, 3))]
+        return make(rng, p)
+
+    return generate_value(rng, node, p)
+
+
+# Generates the keyValues representation of the n-th entity of a model
+def generate_entity(rng, model, n):
+    entity = {
+        'id': 'urn:ngsi-ld:{}:{:08d}'.format(model['type'], n),
+        'type': model['type']
+    }
+
+    required = set(model['required'])
+    excluded = set()
+
+    # One of the alternative sets of required properties is chosen. For oneOf
+    # the properties only required by the other alternatives are left out
+    for key, alternatives in model['choices']:
+        chosen = alternatives[rng.randrange(len(alternatives))]
+        required.update(chosen)
+        if key == 'oneOf':
+            excluded.update(p for a in alternatives if a is not chosen for p in a if p not in required)
+
+    for p in model['properties']:
+        if p in entity or p in excluded:
+            continue
+
+        if p not in required and rng.random() >= OPTIONAL_PROBABILITY:
+            continue
+
+        is_valid = model['validators'][p]
+        for attempt in range(MAX_ATTRIBUTE_ATTEMPTS):
+            entity[p] = generate_attribute(rng, model, p, attempt)
+            if is_valid is None or is_valid(entity[p]):
+                break
+
+    return entity
+
+
+# Generates lazily count keyValues entities, taking the models in turn. Entities which
+# are not valid are generated again, stats counts the entities rejected.
+# Each chunk of CHUNK_SIZE entities has its own random number generator, so the
+# chunks can be generated in parallel and the result does not depend on the workers
+def generate_entities(models, count, seed, check=True, stats=None, start=0):
+    rng = None
+
+    for n in range(start, start + count):
+        if rng is None or n % CHUNK_SIZE == 0:
+            rng = random.Random('{}:{}'.format(seed, n // CHUNK_SIZE))
+
+        model = models[n % len(models)]
+
+        for _ in range(MAX_ATTEMPTS):
+            entity = generate_entity(rng, model, n)
+            if not check or validate_entity(entity, model['validator']) is None:
+                break
+            if stats is not None:
+                stats['rejected'] = stats.get('rejected', 0) + 1
+        else:
+            raise ValueError('No valid {} entity could be generated'.format(model['type']))
+
+        yield entity
+
+
+# Converts lazily keyValues entities into the requested representation
+def represent(entities, models, entity_format, ld_context):
+    attr_types = {m['type']: m['attr_types'] for m in models}
+
+    for entity in entities:
+        if entity_format == 'normalized':
+            yield keyValues_2_normalized(entity, attr_types[entity['type']])
+        elif entity_format == 'LD':
+            yield keyValues_2_LD(entity, ld_context, attr_types[entity['type']])
+        else:
+            yield entity
+
+
+# Models are compiled only once per (worker) process
+@lru_cache(maxsize=None)
+def cached_model(schema_file):
+    return compile_model(schema_file)
+
+
+# Generates a chunk of entities as NDJSON text. Runs in a worker process
+def generate_chunk(schema_files, start, count, seed, check, entity_format, ld_context):
+    models = [cached_model(f) for f in schema_files]
+    stats = {}
+
+    out = io.StringIO()
+    entities = generate_entities(models, count, seed, check, stats, start)
+    write_entities(represent(entities, models, entity_format, ld_context), out)
+
+    return out.getvalue(), stats.get('rejected', 0)
+
+
+# Generates the entities with a pool of processes, at most 2 chunks per worker are pending
+def generate_parallel(schema_files, count, seed, check, entity_format, ld_context, outfile, workers):
+    rejected = 0
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = iter(range(0, count, CHUNK_SIZE))
+        window = 2 * (workers or os.cpu_count() or 1)
+
+        for start in chunks:
+            pending.append(executor.submit(generate_chunk, schema_files, start, min(CHUNK_SIZE, count - start),
+                                           seed, check, entity_format, ld_context))
+
+            while len(pending) >= window or (len(pending) > 0 and start + CHUNK_SIZE >= count):
+                text, chunk_rejected = pending.popleft().result()
+                outfile.write(text)
+                rejected += chunk_rejected
+
+    return rejected
+
+
+def main(args):
+    start = time.perf_counter()
+
+    schemas = schema_index(args.f)
+    for t in args.t:
+        if t not in schemas:
+            print('No schema found for the entity type ' + t, file=sys.stderr)
+            exit(1)
+
+    schema_files = tuple(schemas[t] for t in args.t)
+    check = not args.no_check
+
+    # Broken schemas are reported before any worker is started
+    try:
+        models = [cached_model(f) for f in schema_files]
+    except Exception as e:
+        print('The schemas cannot be compiled: {}'.format(e), file=sys.stderr)
+        exit(1)
+
+    with open_stream(args.o, 'w') as outfile:
+        if args.j == 1:
+            stats = {}
+            entities = generate_entities(models, args.n, args.seed, check, stats)
+            write_entities(represent(entities, models, args.format, args.u), outfile)
+            rejected = stats.get('rejected', 0)
+        else:
+            rejected = generate_parallel(schema_files, args.n, args.seed, check, args.format, args.u, outfile, args.j)
+
+    print_stats(args.n, time.perf_counter() - start)
+    print('{} invalid entities generated again'.format(rejected), file=sys.stderr)
+
+
+# Entry point
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-t', action='append', required=True, help='entity type (can be repeated)')
+    parser.add_argument('-n', type=int, default=1000, help='number of entities')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random number generator')
+    parser.add_argument('--format', choices=['keyValues', 'normalized', 'LD'], default='keyValues')
+    parser.add_argument('-o', default='-', help='output file (default: stdout)')
+    parser.add_argument('-u', default=default_ld_context, help='target LD @context (LD format)')
+    parser.add_argument('-f', default=default_specs_folder, help='specs folder')
+    parser.add_argument('-j', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--no-check', action='store_true', help='do not check the entities against the schemas')
+
+    arguments = parser.parse_args()
+
+    main(arguments)
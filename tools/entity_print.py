@@ -10,60 +10,39 @@ Author: José Manuel Cantera
 """
 
 import json
-from copy import deepcopy
-
-# Prints the JSON string but with the proper member order
 
 
-def print_json_string(entity):
-    entity_only_id = {
+# Returns a shallow copy of the entity with the proper member order:
+# id, type, modifiedAt, createdAt, the rest of members and '@context'
+def order_entity(entity):
+    out = {
         'id': entity['id'],
+        'type': entity['type']
     }
 
-    out = json.dumps(entity_only_id, indent=4)[:-2]
-
-    entity_only_type = {
-        'type': entity['type'],
-    }
-
-    # with -2 it is removed the new line char as well
-    out += "," + json.dumps(entity_only_type, indent=4)[1:-2]
-
-    entity_cloned = deepcopy(entity)
-
     if 'modifiedAt' in entity:
-        entity_only_modified_at = {
-            'modifiedAt': entity['modifiedAt'],
-        }
-        out += "," + json.dumps(entity_only_modified_at, indent=4)[1:-2]
-
-        del entity_cloned['modifiedAt']
+        out['modifiedAt'] = entity['modifiedAt']
 
     if 'createdAt' in entity:
-        entity_only_created_at = {
-            'createdAt': entity['createdAt'],
-        }
-        out += "," + json.dumps(entity_only_created_at, indent=4)[1:-2]
+        out['createdAt'] = entity['createdAt']
 
-        del entity_cloned['createdAt']
+    for key in entity:
+        if key not in out and key != '@context':
+            out[key] = entity[key]
 
-    del entity_cloned['id']
-    del entity_cloned['type']
+    # Last go the '@context'
+    if '@context' in entity:
+        out['@context'] = entity['@context']
 
-    if '@context' in entity_cloned:
-        del entity_cloned['@context']
+    return out
 
-    # Now the rest of the entity without the '@context
-    out += "," + json.dumps(entity_cloned, indent=4)[1:-2]
 
-    # Last go the '@context'
-    if '@context' in entity:
-        only_ld_context = {
-            '@context': entity['@context']
-        }
+# Prints the JSON string but with the proper member order
+def print_json_string(entity):
+    return json.dumps(order_entity(entity), indent=4)
 
-        out += "," + json.dumps(only_ld_context, indent=4)[1:]
-    else:
-        out += "\n}"
 
-    return out
+# Same as print_json_string but the JSON is written to a file object
+# while it is being serialized
+def write_json_string(entity, out):
+    json.dump(order_entity(entity), out, indent=4)
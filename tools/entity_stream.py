@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+
+Reads and writes streams of NGSI Entities without loading them in memory.
+
+The input can be NDJSON (one entity per line) or a top level JSON array.
+The output is NDJSON, or a JSON array written entity by entity.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import resource
+from contextlib import nullcontext
+
+# Amount of characters read from the input stream at once
+CHUNK_SIZE = 64 * 1024
+
+BLANKS = ' \t\r\n'
+
+decoder = json.JSONDecoder()
+
+
+# Opens a file for streaming, '-' stands for stdin / stdout
+def open_stream(name, mode):
+    if name == '-':
+        return nullcontext(sys.stdin if 'r' in mode else sys.stdout)
+
+    return open(name, mode)
+
+
+# Yields one by one the entities found in the stream
+def read_entities(stream, chunk_size=CHUNK_SIZE):
+    buf = stream.read(chunk_size)
+    pos = 0
+    in_array = None
+
+    while True:
+        # Blanks (and commas if inside an array) separate the entities
+        while pos < len(buf) and (buf[pos] in BLANKS or (in_array and buf[pos] == ',')):
+            pos += 1
+
+        if pos == len(buf):
+            buf = stream.read(chunk_size)
+            pos = 0
+            if not buf:
+                break
+            continue
+
+        if in_array is None:
+            in_array = buf[pos] == '['
+            if in_array:
+                pos += 1
+                continue
+
+        if in_array and buf[pos] == ']':
+            break
+
+        try:
+            entity, pos = decoder.raw_decode(buf, pos)
+        except ValueError:
+            # The entity is not complete yet. The buffer is at least doubled
+            # so that big entities are not parsed again and again
+            chunk = stream.read(max(chunk_size, len(buf) - pos))
+            if not chunk:
+                raise
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+
+        yield entity
+
+
+# Writes the entities as NDJSON. Returns the number of entities written
+def write_entities(entities, stream):
+    count = 0
+
+    for entity in entities:
+        stream.write(json.dumps(entity))
+        stream.write('\n')
+        count += 1
+
+    return count
+
+
+# Writes the entities as a JSON array. Returns the number of entities written
+def write_entity_array(entities, stream):
+    count = 0
+
+    stream.write('[')
+
+    for entity in entities:
+        if count > 0:
+            stream.write(',')
+        stream.write('\n')
+        stream.write(json.dumps(entity))
+        count += 1
+
+    stream.write('\n')
+    stream.write(']')
+    stream.write('\n')
+
+    return count
+
+
+# Peak resident set size of the current process (in MB)
+def peak_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # macOS reports bytes, Linux reports kilobytes
+    if sys.platform == 'darwin':
+        return rss / (1024 * 1024)
+
+    return rss / 1024
+
+
+def print_stats(count, elapsed):
+    rate = count / elapsed if elapsed > 0 else 0
+
+    print('{} entities in {:.2f}s ({:.0f} entities/sec), peak RSS {:.1f} MB'.format(
+        count, elapsed, rate, peak_rss()), file=sys.stderr)
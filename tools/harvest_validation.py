@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+
+Opt-in validation of the entities sent by the harvesters (NGSI v2 normalized)
+against the schema.json of their Data Model. The keyValues view of every entity
+is validated. At startup the schemas are made self-contained (their $ref are
+replaced using the local copies of the common schemas, see schema_resolver)
+and compiled into Python code with fastjsonschema.
+
+The cost of the validation is measured. If the average cost of an entity goes
+beyond the budget, only one out of every N entities is validated, so that the
+overhead of the harvester stays within the budget.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import math
+import time
+
+import fastjsonschema
+
+from keyValues2Normalized import default_specs_folder
+from schema_resolver import read_json, schema_base, self_contained
+from schema_types import schema_index
+
+# Default cost budget (seconds per entity)
+DEFAULT_BUDGET = 0.001
+
+# Entity type -> compiled validator
+validators = {
+}
+
+stats = {
+    'entities': 0,
+    'validated': 0,
+    'invalid': 0,
+    'seconds': 0.0
+}
+
+budget = DEFAULT_BUDGET
+
+
+# Compiles the validators of the entity types sent by a harvester
+def setup_validation(entity_types, cost_budget=DEFAULT_BUDGET, specs_folder=default_specs_folder):
+    global budget
+
+    schemas = schema_index(specs_folder)
+
+    for entity_type in entity_types:
+        if entity_type not in schemas:
+            raise ValueError('No schema found for the entity type ' + entity_type)
+
+        validators[entity_type] = compile_validator(schemas[entity_type])
+
+    budget = cost_budget
+
+
+def compile_validator(schema_file):
+    schema = read_json(schema_file)
+
+    return fastjsonschema.compile(self_contained(schema, schema_base(schema, schema_file)))
+
+
+# Returns the validation error of an entity (None if it is valid)
+def validate_entity(entity, validator):
+    try:
+        validator(entity)
+    except fastjsonschema.JsonSchemaValueException as e:
+        return e.message
+
+    return None
+
+
+# The keyValues view of a normalized entity, which is what the schemas describe
+def key_values(entity):
+    return {k: v['value'] if isinstance(v, dict) and 'value' in v else v for k, v in entity.items()}
+
+
+# One out of every 'stride' entities is validated to stay within the budget
+def sampling_stride():
+    if stats['validated'] == 0:
+        return 1
+
+    return max(1, math.ceil(stats['seconds'] / stats['validated'] / budget))
+
+
+# Returns the entities which are valid (or not checked), the others are logged and left out
+def validate_entities(entities, logger=None):
+    out = []
+
+    stride = sampling_stride()
+
+    for entity in entities:
+        stats['entities'] += 1
+
+        validator = validators.get(entity.get('type'))
+        if validator is None or stats['entities'] % stride != 0:
+            out.append(entity)
+            continue
+
+        start = time.perf_counter()
+        error = validate_entity(key_values(entity), validator)
+        stats['seconds'] += time.perf_counter() - start
+        stats['validated'] += 1
+
+        if error is not None:
+            stats['invalid'] += 1
+            if logger:
+                logger.error('Entity %s is not valid and it will not be sent: %s', entity.get('id'), error)
+        else:
+            out.append(entity)
+
+    return out
+
+
+# Cost of the validation (in microseconds): per validated entity and per entity sent
+def validation_metrics():
+    return {
+        'entities': stats['entities'],
+        'validated': stats['validated'],
+        'invalid': stats['invalid'],
+        'cost_per_validated_entity_us': 1e6 * stats['seconds'] / stats['validated'] if stats['validated'] else 0,
+        'cost_per_entity_us': 1e6 * stats['seconds'] / stats['entities'] if stats['entities'] else 0,
+        'sampling_stride': sampling_stride()
+    }
+
+
+def validation_report():
+    return '{entities} entities, {validated} validated, {invalid} invalid, ' \
+           '{cost_per_validated_entity_us:.0f} us per validated entity, ' \
+           '{cost_per_entity_us:.0f} us per entity (1 out of {sampling_stride} validated)'.format(**validation_metrics())
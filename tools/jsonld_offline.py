@@ -0,0 +1,390 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Expands and compacts NGSI-LD Entities without network access.
+
+The @context documents referenced by the entities (the Data Models context.jsonld
+and the ETSI NGSI-LD core context) are read from local copies and compiled once
+into a term table (term -> IRI, type coercion and container) and its reverse.
+
+Only the subset of JSON-LD used by NGSI-LD entities is supported: term
+definitions with @id, @type (@id, @vocab or a datatype) and @container
+(@list, @set), compact IRIs (prefix:suffix) and @vocab.
+
+Usage: jsonld_offline.py expand|compact [input file|-] [output file|-] [ld_context ...]
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import sys
+import json
+import time
+from functools import lru_cache
+
+from entity_stream import open_stream, read_entities, write_entities, print_stats
+from normalized2LD import etsi_core_context
+
+tools_folder = os.path.dirname(os.path.abspath(__file__))
+
+# Published @context URL -> local copy
+context_files = {
+    'https://schema.lab.fiware.org/ld/context': os.path.join(tools_folder, '..', 'context.jsonld'),
+    'https://schema.lab.fiware.org/ld/context.jsonld': os.path.join(tools_folder, '..', 'context.jsonld'),
+    etsi_core_context: os.path.join(tools_folder, 'ngsi-ld-core-context.jsonld')
+}
+
+default_contexts = ['https://schema.lab.fiware.org/ld/context', etsi_core_context]
+
+KEYWORDS = ['@id', '@type', '@value', '@list', '@set', '@language', '@index', '@graph']
+
+
+def read_json(infile):
+    with open(infile) as data_file:
+        data = json.loads(data_file.read())
+
+    return data
+
+
+# Returns the term definitions of a @context (a URL or an inline dictionary)
+def context_definitions(context):
+    if isinstance(context, dict):
+        return context.get('@context', context)
+
+    if context not in context_files:
+        raise ValueError('No local copy of the @context ' + context)
+
+    return read_json(context_files[context])['@context']
+
+
+# Compiles a list of @context (the later ones override the former ones) into a table:
+#  - 'terms': term -> (IRI, type coercion, container)
+#  - 'vocab': the @vocab IRI (or None)
+#  - 'reverse': IRI -> terms which expand to it, best candidates first
+@lru_cache(maxsize=32)
+def compile_contexts(contexts):
+    definitions = {}
+
+    for context in contexts:
+        definitions.update(context_definitions(json.loads(context) if context.startswith('{') else context))
+
+    vocab = definitions.pop('@vocab', None)
+
+    table = {
+        'terms': {},
+        'vocab': vocab,
+        'reverse': {}
+    }
+
+    # Raw IRIs first, as compact IRIs in other definitions can refer to them
+    raw = {}
+    for term, definition in definitions.items():
+        if isinstance(definition, str):
+            raw[term] = definition
+        elif isinstance(definition, dict):
+            raw[term] = definition.get('@id', term)
+
+    for term, definition in definitions.items():
+        if term not in raw:
+            continue
+
+        iri = resolve_compact_iri(raw[term], raw, vocab)
+
+        type_mapping = None
+        container = None
+        if isinstance(definition, dict):
+            type_mapping = definition.get('@type')
+            if type_mapping is not None and type_mapping not in ['@id', '@vocab']:
+                type_mapping = resolve_compact_iri(type_mapping, raw, vocab)
+            container = definition.get('@container')
+
+        table['terms'][term] = (iri, type_mapping, container)
+
+    for term, (iri, _, _) in table['terms'].items():
+        table['reverse'].setdefault(iri, []).append(term)
+
+    # As JSON-LD, the shortest (and then the lexicographically least) term wins
+    for iri in table['reverse']:
+        table['reverse'][iri].sort(key=lambda t: (len(t), t))
+
+    return table
+
+
+def resolve_compact_iri(value, raw, vocab):
+    if value in KEYWORDS:
+        return value
+
+    if value in raw and raw[value] != value:
+        return resolve_compact_iri(raw[value], raw, vocab)
+
+    if ':' in value:
+        prefix, suffix = value.split(':', 1)
+        if prefix in raw and not suffix.startswith('//'):
+            return resolve_compact_iri(raw[prefix], raw, vocab) + suffix
+        return value
+
+    return (vocab or '') + value
+
+
+# Expands a term or a compact IRI. Identifiers (vocab=False) are not vocabulary relative
+def expand_iri(table, value, vocab=True):
+    if value in KEYWORDS:
+        return value
+
+    if vocab and value in table['terms']:
+        return table['terms'][value][0]
+
+    if ':' in value:
+        prefix, suffix = value.split(':', 1)
+        if prefix in table['terms'] and not suffix.startswith('//'):
+            return table['terms'][prefix][0] + suffix
+        return value
+
+    if vocab and table['vocab'] is not None:
+        return table['vocab'] + value
+
+    return value
+
+
+# Contexts of an entity as a hashable key for compile_contexts
+def contexts_key(contexts):
+    if not isinstance(contexts, list):
+        contexts = [contexts]
+
+    return tuple(json.dumps(c, sort_keys=True) if isinstance(c, dict) else c for c in contexts)
+
+
+# Expands an entity. Returns its node object, the expanded
+# JSON-LD document is a list with it
+def expand(entity, contexts=None):
+    if contexts is None:
+        contexts = entity.get('@context', default_contexts)
+
+    table = compile_contexts(contexts_key(contexts))
+
+    return expand_element(table, None, entity)
+
+
+def expand_element(table, active_property, element):
+    if isinstance(element, list):
+        out = []
+        for item in element:
+            expanded = expand_element(table, active_property, item)
+            if isinstance(item, list) and term_container(table, active_property) == '@list':
+                expanded = {'@list': expanded}
+            if isinstance(expanded, list):
+                out.extend(expanded)
+            elif expanded is not None:
+                out.append(expanded)
+        return out
+
+    if not isinstance(element, dict):
+        return expand_value(table, active_property, element)
+
+    if '@value' in element:
+        out = {'@value': element['@value']}
+        if '@type' in element:
+            out['@type'] = expand_iri(table, element['@type'])
+        return out
+
+    out = {}
+
+    for key, value in element.items():
+        if key == '@context':
+            continue
+
+        expanded_key = expand_iri(table, key)
+
+        if expanded_key == '@id':
+            out['@id'] = expand_iri(table, value, vocab=False)
+        elif expanded_key == '@type':
+            out['@type'] = [expand_iri(table, t) for t in (value if isinstance(value, list) else [value])]
+        elif ':' in expanded_key:
+            expanded = expand_element(table, key, value)
+            # As JSON-LD, a null value drops the property
+            if expanded is None:
+                continue
+            if term_container(table, key) == '@list':
+                expanded = [{'@list': expanded if isinstance(expanded, list) else [expanded]}]
+            elif not isinstance(expanded, list):
+                expanded = [expanded]
+            out.setdefault(expanded_key, []).extend(expanded)
+
+    return out
+
+
+def expand_value(table, active_property, value):
+    if value is None:
+        return None
+
+    type_mapping = None
+    if active_property in table['terms']:
+        type_mapping = table['terms'][active_property][1]
+
+    if isinstance(value, str):
+        if type_mapping == '@id':
+            return {'@id': expand_iri(table, value, vocab=False)}
+        if type_mapping == '@vocab':
+            return {'@id': expand_iri(table, value)}
+
+    if type_mapping is not None and type_mapping not in ['@id', '@vocab', '@none']:
+        return {'@value': value, '@type': type_mapping}
+
+    return {'@value': value}
+
+
+def term_container(table, term):
+    if term in table['terms']:
+        return table['terms'][term][2]
+
+    return None
+
+
+# Compacts the node object of an entity using the given contexts,
+# which are added to the result as its @context
+def compact(node, contexts=None):
+    if contexts is None:
+        contexts = default_contexts
+
+    table = compile_contexts(contexts_key(contexts))
+
+    out = compact_node(table, node)
+    out['@context'] = contexts
+
+    return out
+
+
+# Compacts an IRI into a term (or a compact / vocabulary relative IRI)
+def compact_iri(table, iri, vocab=True):
+    if vocab and iri in table['reverse']:
+        return table['reverse'][iri][0]
+
+    if vocab and table['vocab'] and iri.startswith(table['vocab']):
+        suffix = iri[len(table['vocab']):]
+        if suffix and ':' not in suffix and suffix not in table['terms']:
+            return suffix
+
+    return iri
+
+
+# Selects the term for a property and its expanded values (matching type coercion and container)
+def select_term(table, iri, values):
+    candidates = table['reverse'].get(iri, [])
+
+    is_list = len(values) == 1 and isinstance(values[0], dict) and '@list' in values[0]
+    items = values[0]['@list'] if is_list else values
+
+    for term in candidates:
+        _, type_mapping, container = table['terms'][term]
+        if (container == '@list') != is_list:
+            continue
+        if all(value_matches(item, type_mapping) for item in items):
+            return term, type_mapping, container
+
+    return compact_iri(table, iri) if not candidates else None, None, None
+
+
+def value_matches(item, type_mapping):
+    if not isinstance(item, dict) or '@list' in item:
+        return True
+
+    if '@value' in item:
+        return type_mapping is None or item.get('@type') == type_mapping
+
+    if set(item) == {'@id'}:
+        return type_mapping in [None, '@id', '@vocab']
+
+    # Node objects (e.g. NGSI-LD Properties and Relationships) are never coerced
+    return True
+
+
+def compact_node(table, node):
+    out = {}
+
+    for key, values in node.items():
+        if key == '@id':
+            out[compact_iri(table, '@id')] = values
+        elif key == '@type':
+            types = [compact_iri(table, t) for t in values]
+            out[compact_iri(table, '@type')] = types[0] if len(types) == 1 else types
+        else:
+            term, type_mapping, container = select_term(table, key, values)
+            if term is None:
+                term = key
+
+            if container == '@list':
+                out[term] = compact_list(table, values[0]['@list'], type_mapping)
+            else:
+                compacted = [compact_item(table, v, type_mapping) for v in values]
+                out[term] = compacted[0] if len(compacted) == 1 and container != '@set' else compacted
+
+    return out
+
+
+def compact_list(table, items, type_mapping):
+    out = []
+
+    for item in items:
+        if isinstance(item, dict) and '@list' in item:
+            out.append(compact_list(table, item['@list'], type_mapping))
+        else:
+            out.append(compact_item(table, item, type_mapping))
+
+    return out
+
+
+def compact_item(table, item, type_mapping):
+    if '@list' in item:
+        return {'@list': compact_list(table, item['@list'], None)}
+
+    if '@value' in item:
+        if item.get('@type') is None or item.get('@type') == type_mapping:
+            return item['@value']
+        return {
+            '@type': compact_iri(table, item['@type']),
+            '@value': item['@value']
+        }
+
+    if set(item) == {'@id'}:
+        if type_mapping == '@id':
+            return item['@id']
+        if type_mapping == '@vocab':
+            return compact_iri(table, item['@id'])
+
+    return compact_node(table, item)
+
+
+# Expands lazily a stream of entities
+def expand_stream(entities, contexts=None):
+    for entity in entities:
+        yield expand(entity, contexts)
+
+
+# Compacts lazily a stream of node objects
+def compact_stream(nodes, contexts=None):
+    for node in nodes:
+        yield compact(node, contexts)
+
+
+def main(args):
+    start = time.perf_counter()
+
+    contexts = args[4:] if len(args) > 4 else None
+
+    with open_stream(args[2], 'r') as infile, open_stream(args[3], 'w') as outfile:
+        if args[1] == 'expand':
+            count = write_entities(expand_stream(read_entities(infile), contexts), outfile)
+        else:
+            count = write_entities(compact_stream(read_entities(infile), contexts), outfile)
+
+    print_stats(count, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] not in ['expand', 'compact']:
+        print("Usage: jsonld_offline expand|compact [input file|-] [output file|-] [ld_context ...]")
+        exit(-1)
+
+    main(sys.argv)
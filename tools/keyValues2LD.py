@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Converts an NGSI v2 Simplified Representation (a.k.a. keyValues)
+directly into an NGSI-LD Representation.
+
+The result is the same as running keyValues2Normalized and then normalized2LD
+but in one pass, without intermediate dictionaries or files.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import sys
+import json
+import time
+
+from entity_print import write_json_string
+from entity_stream import open_stream, read_entities, write_entities, print_stats
+from keyValues2Normalized import attribute_type, default_specs_folder
+from normalized2LD import etsi_core_context, ld_id, ld_object, normalize_date
+from schema_types import attribute_types, compile_schema
+
+
+# attr_types is the table attribute -> NGSI type compiled from the schema (see schema_types).
+# keyValues carry no metadata, optionally:
+#  - unit_codes (attribute -> UN/CEFACT code) adds 'unitCode' to the Properties listed
+#  - observed_at (name of an attribute, e.g. 'dateObserved') adds 'observedAt' to all the Properties
+def keyValues_2_LD(entity, ld_context_uri, attr_types=None, unit_codes=None, observed_at=None):
+    out = {
+        '@context': [ld_context_uri, etsi_core_context]
+    }
+
+    observed_at_value = None
+    if observed_at is not None and observed_at in entity:
+        observed_at_value = normalize_date(entity[observed_at])
+
+    for key in entity:
+        value = entity[key]
+
+        if key == 'id':
+            out[key] = ld_id(value, entity['type'])
+            continue
+
+        if key == 'type':
+            out[key] = value
+            continue
+
+        if key == 'dateCreated':
+            out['createdAt'] = normalize_date(value)
+            continue
+
+        if key == 'dateModified':
+            out['modifiedAt'] = normalize_date(value)
+            continue
+
+        attr_type = attribute_type(key, attr_types)
+
+        if attr_type == 'Relationship':
+            if isinstance(value, list):
+                ld_attr = {
+                    'type': 'Relationship',
+                    'object': [ld_object(key, obj) for obj in value]
+                }
+            else:
+                ld_attr = {
+                    'type': 'Relationship',
+                    'object': ld_object(key, str(value))
+                }
+        elif attr_type == 'DateTime':
+            ld_attr = {
+                'type': 'Property',
+                'value': {
+                    '@type': 'DateTime',
+                    '@value': normalize_date(value)
+                }
+            }
+        elif attr_type == 'PostalAddress':
+            ld_attr = {
+                'type': 'Property',
+                'value': dict(value, type='PostalAddress')
+            }
+        else:
+            ld_attr = {
+                'type': 'Property',
+                'value': value
+            }
+
+        if key == 'location':
+            ld_attr['type'] = 'GeoProperty'
+
+        if ld_attr['type'] == 'Property':
+            if observed_at_value is not None:
+                ld_attr['observedAt'] = observed_at_value
+
+            if unit_codes is not None and key in unit_codes:
+                ld_attr['unitCode'] = unit_codes[key]
+
+        out[key] = ld_attr
+
+    return out
+
+
+# Converts lazily a stream of entities, using the schema of each entity type
+def keyValues_2_LD_stream(entities, ld_context_uri, specs_folder, unit_codes=None, observed_at=None):
+    for entity in entities:
+        attr_types = attribute_types(entity.get('type'), specs_folder)
+        yield keyValues_2_LD(entity, ld_context_uri, attr_types, unit_codes, observed_at)
+
+
+def read_json(infile):
+    with open(infile) as data_file:
+        data = json.loads(data_file.read())
+
+    return data
+
+
+def write_json(data, outfile):
+    with open(outfile, 'w') as data_file:
+        write_json_string(data, data_file)
+        data_file.write("\n")
+
+
+def main(args):
+    data = read_json(args[1])
+
+    # The schema.json next to the example is used if present
+    schema_file = os.path.join(os.path.dirname(os.path.abspath(args[1])), 'schema.json')
+    attr_types = None
+    if os.path.isfile(schema_file):
+        attr_types = compile_schema(schema_file)
+
+    result = keyValues_2_LD(data, args[3], attr_types)
+    write_json(result, args[2])
+
+
+# Batch mode, entities are read from NDJSON or a JSON array and written as NDJSON
+def main_stream(args):
+    start = time.perf_counter()
+
+    specs_folder = args[5] if len(args) > 5 else default_specs_folder
+
+    with open_stream(args[2], 'r') as infile, open_stream(args[3], 'w') as outfile:
+        entities = keyValues_2_LD_stream(read_entities(infile), args[4], specs_folder)
+        count = write_entities(entities, outfile)
+
+    print_stats(count, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) in [5, 6] and sys.argv[1] == '--stream':
+        main_stream(sys.argv)
+    elif len(sys.argv) == 4:
+        main(sys.argv)
+    else:
+        print("Usage: keyValues2LD [input file] [output file] [target ld_context]")
+        print("       keyValues2LD --stream [input file|-] [output file|-] [target ld_context] [specs folder]")
+        exit(-1)
@@ -11,13 +11,58 @@ Author: José Manuel Cantera
 
 """
 
+import os
 import sys
 import json
+import time
 
-from entity_print import print_json_string
+from entity_print import write_json_string
+from entity_stream import open_stream, read_entities, write_entities, print_stats
+from schema_types import attribute_types, compile_schema
 
+default_specs_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'specs')
 
-def keyValues_2_normalized(entity):
+
+# Guesses the NGSI type of an attribute from its name
+def guess_type(key):
+    out = None
+
+    if key == 'location':
+        out = 'geo:json'
+
+    if key.startswith('date'):
+        out = 'DateTime'
+
+    if key == 'address':
+        out = 'PostalAddress'
+
+    if key.startswith('ref'):
+        out = 'Relationship'
+
+    if key.startswith('has'):
+        out = 'Relationship'
+
+    return out
+
+
+# Returns the NGSI type of an attribute. attr_types is the table attribute -> NGSI type
+# compiled from the schema (see schema_types). Attributes not found there, or declared
+# just as strings (many schemas declare refXXX or dateXXX as plain strings), get a guessed type.
+# A refXXX / hasXXX declared as an array (of anything) is a Relationship too
+def attribute_type(key, attr_types):
+    attr_type = None
+    if attr_types is not None:
+        attr_type = attr_types.get(key)
+
+    if attr_type is None or attr_type == 'Text':
+        attr_type = guess_type(key) or attr_type
+    elif attr_type == 'StructuredValue' and guess_type(key) == 'Relationship':
+        attr_type = 'Relationship'
+
+    return attr_type
+
+
+def keyValues_2_normalized(entity, attr_types=None):
     out = {}
 
     for key in entity:
@@ -29,22 +74,17 @@ def keyValues_2_normalized(entity):
             'value': entity[key]
         }
 
-        if key == 'location':
-            out[key]['type'] = 'geo:json'
+        attr_type = attribute_type(key, attr_types)
+        if attr_type is not None:
+            out[key]['type'] = attr_type
 
-        if key.startswith('date'):
-            out[key]['type'] = 'DateTime'
-
-        if key == 'address':
-            out[key]['type'] = 'PostalAddress'
-
-        if key.startswith('ref'):
-            out[key]['type'] = 'Relationship'
+    return out
 
-        if key.startswith('has'):
-            out[key]['type'] = 'Relationship'
 
-    return out
+# Converts lazily a stream of entities, using the schema of each entity type
+def keyValues_2_normalized_stream(entities, specs_folder):
+    for entity in entities:
+        yield keyValues_2_normalized(entity, attribute_types(entity.get('type'), specs_folder))
 
 
 def read_json(infile):
@@ -56,19 +96,44 @@ def read_json(infile):
 
 def write_json(data, outfile):
     with open(outfile, 'w') as data_file:
-        data_file.write(print_json_string(data))
+        write_json_string(data, data_file)
         data_file.write("\n")
 
 
 def main(args):
     data = read_json(args[1])
-    result = keyValues_2_normalized(data)
-    write_json(result, 'example-normalized.json')
+
+    # The schema.json next to the example is used if present
+    schema_file = os.path.join(os.path.dirname(os.path.abspath(args[1])), 'schema.json')
+    attr_types = None
+    if os.path.isfile(schema_file):
+        attr_types = compile_schema(schema_file)
+
+    result = keyValues_2_normalized(data, attr_types)
+
+    outfile = args[2] if len(args) > 2 else 'example-normalized.json'
+    write_json(result, outfile)
+
+
+# Batch mode, entities are read from NDJSON or a JSON array and written as NDJSON
+def main_stream(args):
+    start = time.perf_counter()
+
+    specs_folder = args[4] if len(args) > 4 else default_specs_folder
+
+    with open_stream(args[2], 'r') as infile, open_stream(args[3], 'w') as outfile:
+        entities = keyValues_2_normalized_stream(read_entities(infile), specs_folder)
+        count = write_entities(entities, outfile)
+
+    print_stats(count, time.perf_counter() - start)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: keyvalues2Normalized [file]")
+    if len(sys.argv) in [4, 5] and sys.argv[1] == '--stream':
+        main_stream(sys.argv)
+    elif len(sys.argv) in [2, 3]:
+        main(sys.argv)
+    else:
+        print("Usage: keyvalues2Normalized [file] [output file]")
+        print("       keyvalues2Normalized --stream [input file|-] [output file|-] [specs folder]")
         exit(-1)
-
-    main(sys.argv)
@@ -17,8 +17,17 @@ Authors: José M. Cantera, Dmitrii Demin
 import json
 import yaml
 import os
+import hashlib
 from datetime import datetime, timezone
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from glob import glob
+
+from schema_index import index_schema, lookup
+from schema_resolver import ENTITY_ID, base_folder, schema_base
+from schema_types import collect_properties
+from term_index import write_index
 
 # The aggregated @context will be stored here
 aggregated_context = {
@@ -34,6 +43,34 @@ terms_list = {
 alert_list = [
 ]
 
+# The terms used by each entity type will be stored here
+type_terms = {
+}
+
+# The terms used by the schemas of each domain (Weather, Parking...) will be stored here
+domain_terms = {
+}
+
+# The schema which gave the current definition of each term
+term_sources = {
+}
+
+# The terms defined differently by several schemas will be stored here
+# as (term, previous schema, overriding schema)
+conflict_list = [
+]
+
+tools_folder = os.path.dirname(os.path.abspath(__file__))
+
+# Any change in these files invalidates the cache
+generator_files = ['ldcontext_generator.py', 'schema_index.py', 'schema_resolver.py', 'schema_types.py']
+
+# Extraction results of previous runs, by schema file (see load_cache)
+schema_cache = {
+    "version": None,
+    "schemas": {}
+}
+
 # Template to prepare a valid URL of a schema for a term mapping
 schema_url = 'https://fiware.github.io/data-models/{}'
 specification_url = 'https://fiware-datamodels.readthedocs.io/en/latest/{}'
@@ -41,9 +78,6 @@ specification_url = 'https://fiware-datamodels.readthedocs.io/en/latest/{}'
 # Agri* schemas stored at another github organization
 agri_url = 'https://github.com/GSMADeveloper/NGSI-LD-Entities/blob/master/definitions/{}.md'
 
-# Used to detect attributes which are actually relationships
-ENTITY_ID = 'https://fiware.github.io/data-models/common-schema.json#/definitions/EntityIdentifierType'
-
 
 def read_json(infile):
     with open(infile) as data_file:
@@ -58,6 +92,11 @@ def write_json(data, outfile):
         data_file.write("\n")
 
 
+def file_hash(path):
+    with open(path, 'rb') as data_file:
+        return hashlib.sha1(data_file.read()).hexdigest()
+
+
 def write_yaml(data, outfile):
     with open(outfile, 'w') as data_file:
         data_file.write(yaml.dump(data))
@@ -90,10 +129,35 @@ def find_node(schema, node_name):
     return result
 
 
+# Finds a node with the index of the schema (see schema_index)
+# or traversing it if there is no index. If the base URL of the node
+# is given, the $ref are followed
+def find_indexed(schema, node_name, index, base=None):
+    if index is None:
+        return find_node(schema, node_name)
+
+    return lookup(index, schema, node_name, base)
+
+
+# Returns the properties of a schema as a dict name -> (node, base URL of the node).
+# If the base URL of the schema is given all the properties are collected following
+# allOf / anyOf / oneOf and $ref, otherwise only the first 'properties' node is used
+def schema_properties(schema, index, base):
+    if base is not None:
+        return collect_properties(schema, base)
+
+    properties = find_indexed(schema, 'properties', index)
+
+    if properties is None:
+        return None
+
+    return {p: (properties[p], None) for p in properties}
+
+
 # extracts the properties dictionary
 # A list of dictionaries is returned
-def extract_properties(schema):
-    properties = find_node(schema, 'properties')
+def extract_properties(schema, index=None, base=None):
+    properties = schema_properties(schema, index, base)
 
     out = []
 
@@ -106,15 +170,17 @@ def extract_properties(schema):
             prop['type'] = 'Property'
             prop['name'] = p
 
-            ref = find_node(properties[p], '$ref')
+            node, node_base = properties[p]
+
+            ref = find_indexed(node, '$ref', index, node_base)
             if ref is not None and ref == ENTITY_ID:
                 prop['type'] = 'Relationship'
 
-            enum = find_node(properties[p], 'enum')
+            enum = find_indexed(node, 'enum', index, node_base)
             if enum is not None:
                 prop['isEnumerated'] = True
 
-            pformat = find_node(properties[p], 'format')
+            pformat = find_indexed(node, 'format', index, node_base)
             if pformat is not None and pformat == 'date-time':
                 prop['isDate'] = True
 
@@ -124,13 +190,13 @@ def extract_properties(schema):
 
 
 # extracts the entity type
-def extract_entity_type(schema):
+def extract_entity_type(schema, index=None, base=None):
     out = None
 
-    properties = find_node(schema, 'properties')
+    properties = schema_properties(schema, index, base)
 
     if properties is not None and 'type' in properties:
-        type_node = properties['type']
+        type_node = properties['type'][0]
 
         if 'enum' in type_node and len(type_node['enum']) > 0:
             out = type_node['enum'][0]
@@ -139,18 +205,18 @@ def extract_entity_type(schema):
 
 
 # extracts the enumerations
-def extract_enumerations(schema):
+def extract_enumerations(schema, index=None, base=None):
     out = []
 
-    properties = find_node(schema, 'properties')
+    properties = schema_properties(schema, index, base)
 
     if properties is None:
         return out
 
     for p in properties:
         if p != 'type':
-            prop = properties[p]
-            enum = find_node(prop, 'enum')
+            node, node_base = properties[p]
+            enum = find_indexed(node, 'enum', index, node_base)
             if enum is not None:
                 if isinstance(enum, list):
                     for item in enum:
@@ -213,11 +279,15 @@ def generate_ld_context_enums(properties, uri_prefix, predefined_mappings):
     return context
 
 
-# Extracts from the schema the relevant JSON-LD @context
-def schema_2_ld_context(schema, uri_prefix, predefined_mappings):
-    properties = extract_properties(schema)
-    entity_type = extract_entity_type(schema)
-    enumerations = extract_enumerations(schema)
+# Extracts from the schema the relevant JSON-LD @context.
+# If the base URL of the schema is given, the $ref are followed
+def schema_2_ld_context(schema, uri_prefix, predefined_mappings, base=None):
+    # The schema is walked only once
+    index = index_schema(schema, base=base)
+
+    properties = extract_properties(schema, index, base)
+    entity_type = extract_entity_type(schema, index, base)
+    enumerations = extract_enumerations(schema, index, base)
 
     ld_context = dict()
 
@@ -235,31 +305,77 @@ def schema_2_ld_context(schema, uri_prefix, predefined_mappings):
     return ld_context
 
 
-def process_file(input_file, uri_prefix, predefined_mappings, terms_mappings):
+# Finds the schemas in a folder (and its subfolders), in sorted order
+def find_schemas(input_file):
+    out = []
+
     if os.path.isfile(input_file) and input_file.endswith('schema.json'):
-        print(input_file)
-        aggregate_ld_context(
-            input_file,
-            uri_prefix,
-            predefined_mappings,
-            terms_mappings)
+        out.append(input_file)
     elif os.path.isdir(input_file):
-        for f in (os.listdir(input_file)):
-            process_file(os.path.join(input_file, f),
-                         uri_prefix, predefined_mappings, terms_mappings)
+        for f in sorted(os.listdir(input_file)):
+            out.extend(find_schemas(os.path.join(input_file, f)))
+
+    return out
+
+
+def process_file(input_file, uri_prefix, predefined_mappings, terms_mappings, workers=None, resolve_refs=True):
+    files = find_schemas(input_file)
+
+    # Schemas whose content did not change since the last run are taken from the cache
+    hashes = {}
+    pending = []
+    for f in files:
+        hashes[f] = file_hash(f)
+        cached = schema_cache['schemas'].get(f)
+        if cached is None or cached['hash'] != hashes[f]:
+            pending.append(f)
+
+    if len(pending) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(extract_ld_context, pending,
+                                   repeat(uri_prefix), repeat(predefined_mappings), repeat(resolve_refs))
+
+            for f, ld_context in zip(pending, results):
+                schema_cache['schemas'][f] = {
+                    'hash': hashes[f],
+                    'ld_context': ld_context
+                }
+
+    # The results are merged always in the same order, whatever the order
+    # in which the extraction finished
+    for f in files:
+        print(f)
+        aggregate_ld_context(f, schema_cache['schemas'][f]['ld_context'], terms_mappings)
 
 
-def aggregate_ld_context(f, uri_prefix, predefined_mappings, terms_mappings):
+# Extracts the LD @context of a schema file. Runs in a worker process
+def extract_ld_context(f, uri_prefix, predefined_mappings, resolve_refs):
+    schema = read_json(f)
+
+    base = None
+    if resolve_refs:
+        base = schema_base(schema, f)
+
+    return schema_2_ld_context(schema, uri_prefix, predefined_mappings, base)
+
+
+def aggregate_ld_context(f, ld_context, terms_mappings):
     global aggregated_context
     global terms_list
     global alert_list
 
-    schema = read_json(f)
-    ld_context = schema_2_ld_context(schema, uri_prefix, predefined_mappings)
+    # The specification file is the same for all the terms of the schema
+    file_to_add = find_file(f, terms_mappings)
+    schema = schema_url.format(f.split('../')[1])
 
     for t in ld_context:
         for p in ld_context[t]:
+            # A term defined differently by a previous schema is overridden
+            if p in aggregated_context and aggregated_context[p] != ld_context[t][p]:
+                conflict_list.append((p, term_sources[p], f))
+
             aggregated_context[p] = ld_context[t][p]
+            term_sources[p] = f
 
             # adding related specifications and schemas
             if p not in terms_list['terms']:
@@ -267,15 +383,77 @@ def aggregate_ld_context(f, uri_prefix, predefined_mappings, terms_mappings):
                                           'schemas': list(),
                                           'type': t}
 
-            terms_list['terms'][p]['schemas'].append(
-                schema_url.format(f.split('../')[1]))
+            terms_list['terms'][p]['schemas'].append(schema)
 
-            file_to_add = find_file(f, terms_mappings)
             if file_to_add:
                 terms_list['terms'][p]['specifications'].append(file_to_add)
             else:
                 alert_list.append(f)
 
+    for entity_type in ld_context.get('Entity Type', {}):
+        terms = type_terms.setdefault(entity_type, set())
+        for t in ld_context:
+            terms.update(ld_context[t])
+
+    domain = schema_domain(f)
+    if domain is not None:
+        terms = domain_terms.setdefault(domain, set())
+        for t in ld_context:
+            terms.update(ld_context[t])
+
+
+# The domain of a schema is the folder below 'specs' (e.g. Weather for specs/Weather/WeatherObserved)
+def schema_domain(f):
+    parts = os.path.normpath(f).split(os.sep)
+
+    if 'specs' in parts[:-2]:
+        return parts[parts.index('specs') + 1]
+
+    return None
+
+
+# Loads the cache of a previous run. It is discarded if the URI prefix, the predefined
+# mappings, the resolution of $ref, this script or the common schemas changed
+def load_cache(cache_file, uri_prefix, predefined_mappings, resolve_refs=True):
+    global schema_cache
+
+    version = hashlib.sha1()
+    version.update(uri_prefix.encode())
+    version.update(json.dumps(predefined_mappings, sort_keys=True).encode())
+    version.update(str(resolve_refs).encode())
+    for f in generator_files:
+        version.update(file_hash(os.path.join(tools_folder, f)).encode())
+    if resolve_refs:
+        for f in common_schemas():
+            version.update(file_hash(f).encode())
+
+    schema_cache = {
+        'version': version.hexdigest(),
+        'schemas': {}
+    }
+
+    if cache_file and os.path.isfile(cache_file):
+        cache = read_json(cache_file)
+        if cache.get('version') == schema_cache['version']:
+            schema_cache['schemas'] = cache['schemas']
+
+
+# The documents referenced by the schemas
+def common_schemas():
+    return sorted(glob(os.path.join(base_folder, '*-schema.json')) +
+                  glob(os.path.join(base_folder, 'specs', '*', '*-schema.json')))
+
+
+def save_cache(cache_file):
+    if cache_file:
+        # Schemas removed since the last run are forgotten
+        for f in list(schema_cache['schemas']):
+            if not os.path.isfile(f):
+                del schema_cache['schemas'][f]
+
+        with open(cache_file, 'w') as data_file:
+            data_file.write(json.dumps(schema_cache))
+
 
 # Finds the specification file associated with the term
 def find_file(f, terms_mappings):
@@ -312,6 +490,31 @@ def write_context_file():
 
     write_json(ld_context, 'context.jsonld')
     write_yaml(terms_list, 'terms_list.yml')
+    write_index('terms_index.db', aggregated_context, terms_list, type_terms)
+
+
+# Writes a minimal @context per domain and per entity type, with only the terms
+# used by their schemas (as defined in the aggregated @context)
+def write_sub_contexts(folder):
+    generated_at = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+    full_size = os.path.getsize('context.jsonld')
+    print('context.jsonld: {} terms, {} bytes'.format(len(aggregated_context), full_size))
+
+    for kind, sub_terms in [('domains', domain_terms), ('types', type_terms)]:
+        os.makedirs(os.path.join(folder, kind), exist_ok=True)
+
+        for name in sorted(sub_terms):
+            sub_context = {
+                '@context': {t: aggregated_context[t] for t in sub_terms[name] if t in aggregated_context},
+                'generatedAt': generated_at
+            }
+
+            outfile = os.path.join(folder, kind, name + '.jsonld')
+            write_json(sub_context, outfile)
+
+            print('{}: {} terms, {} bytes ({:.1%})'.format(
+                outfile, len(sub_context['@context']), os.path.getsize(outfile), os.path.getsize(outfile) / full_size))
 
 
 def main(args):
@@ -320,19 +523,39 @@ def main(args):
     predefined_mappings = read_json('ldcontext_mappings.json')
     terms_mappings = read_json('ldcontext_terms_mappings.json')
 
-    process_file(args.f, uri_prefix, predefined_mappings, terms_mappings)
+    load_cache(args.c, uri_prefix, predefined_mappings, not args.no_refs)
+
+    process_file(args.f, uri_prefix, predefined_mappings, terms_mappings, args.j, not args.no_refs)
+
+    save_cache(args.c)
 
     write_context_file()
 
+    if args.s:
+        write_sub_contexts(args.s)
+
     print("specification file was  not found for this files")
     print("\n".join(sorted(set(alert_list))))
 
+    if len(conflict_list) > 0:
+        print("terms defined differently by several schemas (the last one is used)")
+        for term, previous, current in conflict_list:
+            print('{}: {} overridden by {}'.format(term, previous, current))
+
 
 # Entry point
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('-f', required=True, help='folder')
     parser.add_argument('-u', required=True, help='URI prefix')
+    parser.add_argument('-c', default='ldcontext_cache.json',
+                        help='cache file of the previous runs (empty to disable it)')
+    parser.add_argument('--no-refs', action='store_true',
+                        help='do not follow $ref (only the first properties node of each schema is used)')
+    parser.add_argument('-j', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-s', default='contexts',
+                        help='folder of the @context per domain and entity type (empty to disable them)')
 
     arguments = parser.parse_args()
 
@@ -11,14 +11,30 @@ Author: José Manuel Cantera
 
 """
 
+from __future__ import print_function
+
 import sys
 import json
+import time
 
-from rfc3987 import parse
-from entity_print import print_json_string
+from functools import lru_cache
+from rfc3987 import get_compiled_pattern
+from entity_print import write_json_string
+from entity_stream import open_stream, read_entities, write_entities, write_entity_array, print_stats
 
 etsi_core_context = 'https://uri.etsi.org/ngsi-ld/v1/ngsi-ld-core-context.jsonld'
 
+# Link header value template to give the @context of a JSON payload (NGSI-LD API, 6.3.5)
+ld_context_link_template = '<{}>; rel="http://www.w3.org/ns/json-ld#context"; type="application/ld+json"'
+
+# Max number of strings remembered by the URI classifier
+URI_CACHE_SIZE = 65536
+
+# Same rule used by rfc3987.parse(..., rule='URI'), compiled only once
+uri_pattern = get_compiled_pattern('^%(URI)s$')
+
+ld_uri_schemes = ('urn:', 'http:', 'https:')
+
 
 def ngsild_uri(type_part, id_part):
     template = 'urn:ngsi-ld:{}:{}'
@@ -29,12 +45,8 @@ def ngsild_uri(type_part, id_part):
 # Generates an Entity Id as a URI
 def ld_id(entity_id, entity_type):
     out = entity_id
-    try:
-        d = parse(entity_id, rule='URI')
-        scheme = d['scheme']
-        if scheme != 'urn' and scheme != 'http' and scheme != 'https':
-            raise ValueError
-    except ValueError:
+
+    if not is_ld_uri(entity_id):
         out = ngsild_uri(entity_type, entity_id)
 
     return out
@@ -43,12 +55,8 @@ def ld_id(entity_id, entity_type):
 # Generates a Relationship's object as a URI
 def ld_object(attribute_name, entity_id):
     out = entity_id
-    try:
-        d = parse(entity_id, rule='URI')
-        scheme = d['scheme']
-        if scheme != 'urn' and scheme != 'http' and scheme != 'https':
-            raise ValueError
-    except ValueError:
+
+    if not is_ld_uri(entity_id):
         entity_type = ''
         if attribute_name.startswith('ref'):
             entity_type = attribute_name[3:]
@@ -58,11 +66,23 @@ def ld_object(attribute_name, entity_id):
     return out
 
 
-# Do all the transformation work
-def normalized_2_LD(entity, ld_context_uri):
-    out = {
-        '@context': [ld_context_uri, etsi_core_context]
-    }
+# Checks if a string is a URI with the 'urn', 'http' or 'https' scheme.
+# The scheme of a valid URI is whatever precedes the first colon, so strings
+# without one of the prefixes are discarded without running the full URI grammar.
+# Results are memoized as the same relationship targets appear in many entities,
+# is_ld_uri.cache_info() gives the hits and misses
+@lru_cache(maxsize=URI_CACHE_SIZE)
+def is_ld_uri(value):
+    return value.startswith(ld_uri_schemes) and uri_pattern.match(value) is not None
+
+
+# Do all the transformation work. Without inline_context the @context
+# is not added (it is given once for a batch of entities)
+def normalized_2_LD(entity, ld_context_uri, inline_context=True):
+    out = {}
+
+    if inline_context:
+        out['@context'] = [ld_context_uri, etsi_core_context]
 
     for key in entity:
         if key == 'id':
@@ -128,6 +148,26 @@ def normalized_2_LD(entity, ld_context_uri):
     return out
 
 
+# Converts lazily a stream of entities
+def normalized_2_LD_stream(entities, ld_context_uri, inline_context=True):
+    for entity in entities:
+        yield normalized_2_LD(entity, ld_context_uri, inline_context)
+
+
+# Link header value for a batch of entities without @context. The core
+# @context is always implied by NGSI-LD, so only the target one is linked
+def ld_context_link(ld_context_uri):
+    return ld_context_link_template.format(ld_context_uri)
+
+
+# A batch of entities sharing a single @context, as a JSON-LD document
+def ld_batch_document(entities, ld_context_uri):
+    return {
+        '@context': [ld_context_uri, etsi_core_context],
+        '@graph': entities
+    }
+
+
 def normalize_date(date_str):
     out = date_str
 
@@ -146,7 +186,7 @@ def read_json(infile):
 
 def write_json(data, outfile):
     with open(outfile, 'w') as data_file:
-        data_file.write(print_json_string(data))
+        write_json_string(data, data_file)
         data_file.write("\n")
 
 
@@ -156,9 +196,52 @@ def main(args):
     write_json(result, args[2])
 
 
+# Batch mode, entities are read from NDJSON or a JSON array and written as NDJSON
+def main_stream(args):
+    start = time.perf_counter()
+
+    with open_stream(args[2], 'r') as infile, open_stream(args[3], 'w') as outfile:
+        entities = normalized_2_LD_stream(read_entities(infile), args[4])
+        count = write_entities(entities, outfile)
+
+    print_stats(count, time.perf_counter() - start)
+    print('URI cache: ' + str(is_ld_uri.cache_info()), file=sys.stderr)
+
+
+# Batch mode with a shared @context. The entities are written:
+#  - link: as a JSON array without @context, which is given as a Link header value (printed to stderr)
+#  - graph: inside a single document {"@context": [...], "@graph": [...]}, kept in memory
+def main_batch(args):
+    start = time.perf_counter()
+
+    mode, ld_context_uri = args[2], args[5]
+
+    with open_stream(args[3], 'r') as infile, open_stream(args[4], 'w') as outfile:
+        entities = normalized_2_LD_stream(read_entities(infile), ld_context_uri, inline_context=False)
+
+        if mode == 'link':
+            count = write_entity_array(entities, outfile)
+        else:
+            document = ld_batch_document(list(entities), ld_context_uri)
+            count = len(document['@graph'])
+            outfile.write(json.dumps(document))
+            outfile.write('\n')
+
+    if mode == 'link':
+        print('Link: ' + ld_context_link(ld_context_uri), file=sys.stderr)
+
+    print_stats(count, time.perf_counter() - start)
+
+
 if __name__ == '__main__':
-    if len(sys.argv) != 4:
+    if len(sys.argv) == 5 and sys.argv[1] == '--stream':
+        main_stream(sys.argv)
+    elif len(sys.argv) == 6 and sys.argv[1] == '--batch' and sys.argv[2] in ['link', 'graph']:
+        main_batch(sys.argv)
+    elif len(sys.argv) == 4:
+        main(sys.argv)
+    else:
         print("Usage: normalized2LD [input file] [output file] [target ld_context]")
+        print("       normalized2LD --stream [input file|-] [output file|-] [target ld_context]")
+        print("       normalized2LD --batch link|graph [input file|-] [output file|-] [target ld_context]")
         exit(-1)
-
-    main(sys.argv)
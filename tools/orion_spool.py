@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+
+Spool of the batches that Orion did not accept, kept on the local disk until they are
+sent again (see replay_spool in orion_writer).
+
+The spool is a folder of segments, append-only NDJSON files compressed with gzip: every
+batch is appended as a separate gzip member (a record with the time, the error and the
+entities) and flushed to the disk, so a crash loses at most the record being written.
+The name of a segment is the time (ns) when it was started, so they are replayed from the
+oldest one. A segment is closed when it reaches SEGMENT_BYTES or when it is replayed.
+
+The size of the spool is bounded: beyond max_bytes the oldest segments are dropped.
+The records of a segment replayed in part are not written again, the amount of records
+already sent is kept next to it (.offset file).
+
+The entities rejected by Orion are quarantined: appended, with the error, to an NDJSON
+file of the folder (QUARANTINE_FILE), for inspection. It is not replayed. Without a
+spool, or beyond the size of the spool, they are logged instead.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import gzip
+import glob
+import time
+import json
+import zlib
+import logging
+
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+# Size of a segment before a new one is started
+SEGMENT_BYTES = 4 * 1024 * 1024
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+OFFSET_SUFFIX = '.offset'
+QUARANTINE_FILE = 'quarantine.ndjson'
+
+logger = logging.getLogger('root')
+
+settings = {
+    'folder': None,
+    'max_bytes': DEFAULT_MAX_BYTES
+}
+
+# Segment -> [records, entities, bytes], the current one is the last started and not closed
+segments = {
+}
+
+current = {
+    'segment': None
+}
+
+stats = {
+    'spooled_batches': 0,
+    'spooled_entities': 0,
+    'replayed_entities': 0,
+    'superseded_entities': 0,
+    'dropped_entities': 0,
+    'replay_seconds': 0.0
+}
+
+
+# Opens the spool, the segments left by a previous run are counted to know the backlog
+def setup_spool(folder, max_bytes=DEFAULT_MAX_BYTES):
+    settings['folder'] = folder
+    settings['max_bytes'] = max_bytes
+
+    os.makedirs(folder, exist_ok=True)
+
+    segments.clear()
+    current['segment'] = None
+
+    for segment in sorted(glob.glob(os.path.join(folder, '*' + SEGMENT_SUFFIX))):
+        records = read_segment(segment)
+        skip = read_offset(segment)
+        segments[segment] = [len(records) - skip, sum(len(r['entities']) for r in records[skip:]),
+                             os.path.getsize(segment)]
+
+    if len(segments) > 0:
+        logger.info('Spool: %s', spool_report())
+
+
+def spool_enabled():
+    return settings['folder'] is not None
+
+
+def spool_batch(entities, error):
+    record = {
+        'time': time.time(),
+        'error': error,
+        'entities': entities
+    }
+    member = gzip.compress((json.dumps(record) + '\n').encode('utf-8'))
+
+    segment = current['segment']
+    if segment is None or segments[segment][2] + len(member) > SEGMENT_BYTES:
+        segment = new_segment()
+
+    with open(segment, 'ab') as spool_file:
+        spool_file.write(member)
+        spool_file.flush()
+        os.fsync(spool_file.fileno())
+
+    segments[segment][0] += 1
+    segments[segment][1] += len(entities)
+    segments[segment][2] += len(member)
+
+    stats['spooled_batches'] += 1
+    stats['spooled_entities'] += len(entities)
+
+    enforce_bound()
+
+
+# Entities are quarantined while the file is within the size of the spool
+def quarantine_entity(entity, error):
+    if not spool_enabled():
+        logger.error('Entity rejected due to the %s: %s', error, json.dumps(entity))
+        return
+
+    quarantine = os.path.join(settings['folder'], QUARANTINE_FILE)
+    if os.path.isfile(quarantine) and os.path.getsize(quarantine) > settings['max_bytes']:
+        logger.error('Quarantine beyond %s bytes, entity rejected due to the %s: %s',
+                     settings['max_bytes'], error, json.dumps(entity))
+        return
+
+    with open(quarantine, 'a') as quarantine_file:
+        quarantine_file.write(json.dumps({'time': time.time(), 'error': error, 'entity': entity}) + '\n')
+
+
+def new_segment():
+    segment = os.path.join(settings['folder'], '{:020d}{}'.format(time.time_ns(), SEGMENT_SUFFIX))
+    while segment in segments:
+        segment = os.path.join(settings['folder'], '{:020d}{}'.format(time.time_ns() + 1, SEGMENT_SUFFIX))
+
+    segments[segment] = [0, 0, 0]
+    current['segment'] = segment
+
+    return segment
+
+
+# Drops the oldest segments beyond the size of the spool (the current one is kept)
+def enforce_bound():
+    while sum(s[2] for s in segments.values()) > settings['max_bytes'] and len(segments) > 1:
+        segment = min(segments)
+        stats['dropped_entities'] += segments[segment][1]
+        logger.error('Spool beyond %s bytes, %s entities of %s dropped',
+                     settings['max_bytes'], segments[segment][1], os.path.basename(segment))
+        remove_segment(segment)
+
+
+# The oldest segment to be replayed (closed, so that the new failures go to a new one)
+def oldest_segment():
+    if len(segments) == 0:
+        return None
+
+    segment = min(segments)
+    if segment == current['segment']:
+        current['segment'] = None
+
+    return segment
+
+
+# Records of a segment. A record cut by a crash while it was written is left out
+def read_segment(segment):
+    out = []
+
+    with open(segment, 'rb') as spool_file:
+        data = spool_file.read()
+
+    while len(data) > 0:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            line = decompressor.decompress(data)
+        except zlib.error:
+            logger.error('Spool: damaged record in %s, the rest of the segment is left out', os.path.basename(segment))
+            break
+        if not decompressor.eof:
+            logger.error('Spool: incomplete record at the end of %s left out', os.path.basename(segment))
+            break
+        out.append(json.loads(line.decode('utf-8')))
+        data = decompressor.unused_data
+
+    return out
+
+
+def read_offset(segment):
+    try:
+        with open(segment + OFFSET_SUFFIX) as offset_file:
+            return int(offset_file.read())
+    except (OSError, ValueError):
+        return 0
+
+
+# Records up to offset were replayed
+def write_offset(segment, offset, records, entities):
+    with open(segment + OFFSET_SUFFIX, 'w') as offset_file:
+        offset_file.write(str(offset))
+
+    segments[segment][0] -= records
+    segments[segment][1] -= entities
+
+
+def remove_segment(segment):
+    for f in [segment, segment + OFFSET_SUFFIX]:
+        if os.path.isfile(f):
+            os.remove(f)
+
+    del segments[segment]
+    if current['segment'] == segment:
+        current['segment'] = None
+
+
+# Records of a segment not replayed yet, in groups of about max_entities entities
+# (position after the group, records)
+def pending_records(segment, max_entities):
+    group = []
+    size = 0
+
+    records = read_segment(segment)
+    for position in range(read_offset(segment), len(records)):
+        if len(group) > 0 and size + len(records[position]['entities']) > max_entities:
+            yield position, group
+            group = []
+            size = 0
+        group.append(records[position])
+        size += len(records[position]['entities'])
+
+    if len(group) > 0:
+        yield len(records), group
+
+
+# Time when the oldest segment was started (None if the spool is empty)
+def spool_start():
+    if len(segments) == 0:
+        return None
+
+    return int(os.path.basename(min(segments))[:20]) / 1e9
+
+
+def spool_metrics():
+    start = spool_start()
+
+    return {
+        'backlog_batches': sum(s[0] for s in segments.values()),
+        'backlog_entities': sum(s[1] for s in segments.values()),
+        'backlog_bytes': sum(s[2] for s in segments.values()),
+        'segments': len(segments),
+        'age_seconds': time.time() - start if start else 0,
+        'spooled_entities': stats['spooled_entities'],
+        'replayed_entities': stats['replayed_entities'],
+        'superseded_entities': stats['superseded_entities'],
+        'dropped_entities': stats['dropped_entities'],
+        'replay_entities_per_sec': stats['replayed_entities'] / stats['replay_seconds'] if stats['replay_seconds'] else 0
+    }
+
+
+def spool_report():
+    return '{backlog_entities} entities ({backlog_batches} batches, {backlog_bytes} bytes, {segments} segments) ' \
+           'waiting for {age_seconds:.0f}s, {spooled_entities} spooled, {replayed_entities} replayed ' \
+           '({replay_entities_per_sec:.0f} entities/sec), {superseded_entities} superseded, ' \
+           '{dropped_entities} dropped'.format(**spool_metrics())
@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+"""
+
+Shared writer of the harvesters: sends NGSI v2 entities to Orion (/v2/op/update) in batches.
+
+A single aiohttp session, with its pool of keep-alive connections, lives for the whole
+process, so in service mode (--timeout) every cycle reuses the connections to Orion
+instead of setting up new ones. The session is bound to the event loop where it was
+opened, so the harvesters run all their cycles in the same loop.
+
+Batches are sized by their serialized bytes (and at most limit_entities entities), below
+the request size accepted by Orion. A batch rejected as too large (413) is split, and the
+byte limit is halved for the next batches.
+
+The number of batches in flight is tuned AIMD-style (as TCP congestion control), up to
+limit_target: it grows while Orion answers quickly, and it is halved when the latency goes
+beyond LATENCY_FACTOR times the lowest one observed, or Orion answers 429 or 5xx (those
+batches are sent again after a backoff, up to MAX_RETRIES times). The state is kept
+between cycles.
+
+A batch rejected because of some of its entities (400, 404 or 422) is split in halves,
+recursively, so that the valid entities are sent and the rejected ones are found with
+about 2 * log2(n) more requests for each of them. The rejected entities are quarantined
+(see orion_spool) with the error returned by Orion, or logged if there is no spool.
+
+If a spool is set up (see orion_spool), the batches that failed for a reason that can
+go away (connection problems, timeouts, 408, 429 and 5xx beyond the retries) are written
+to it, and replayed in the background, with a growing backoff, once Orion answers again.
+Replayed entities already sent with a newer value are left out, so that an old value
+never replaces a new one.
+
+The result of every batch is logged (entities, bytes, status, Orion's error and time),
+and the totals are kept for the report of every cycle.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import time
+import logging
+from asyncio import FIRST_COMPLETED, CancelledError, Lock, ensure_future, sleep, wait, TimeoutError as ToE
+from collections import deque
+
+from aiohttp import ClientSession, ClientConnectorError, ClientError, ClientTimeout, ServerDisconnectedError, TCPConnector, \
+    TraceConfig
+from yajl import dumps
+
+from orion_spool import oldest_segment, pending_records, quarantine_entity, remove_segment, segments, setup_spool, \
+    spool_batch, spool_enabled, spool_report, spool_start, write_offset, DEFAULT_MAX_BYTES as DEFAULT_SPOOL_BYTES
+from orion_spool import stats as spool_stats
+
+DEFAULT_LIMIT_ENTITIES = 50     # max amount of entities per 1 request to Orion
+DEFAULT_LIMIT_TARGET = 50       # max amount of parallel requests to Orion
+DEFAULT_LIMIT_BYTES = 1000000   # max size of a request, Orion accepts 1 MB by default
+DEFAULT_ACTION = 'APPEND'
+
+# Batches are not made smaller than this after a 413
+MIN_LIMIT_BYTES = 4096
+
+# Latency (relative to the lowest one) beyond which Orion is considered overloaded
+LATENCY_FACTOR = 3.0
+
+# The lowest latency slowly drifts up, so that it follows the changes of the network
+LATENCY_DRIFT = 0.001
+
+# Batches answered with 429 / 5xx are sent again after BACKOFF * 2 ^ attempt seconds
+MAX_RETRIES = 3
+BACKOFF = 0.5
+
+# Answers which can be due to some entities of the batch, which is then split in halves
+BISECT_STATUSES = [400, 404, 422]
+
+# The spool is replayed after REPLAY_BACKOFF seconds, doubled (up to MAX_REPLAY_BACKOFF)
+# while Orion does not answer to /version within PROBE_TIMEOUT
+REPLAY_BACKOFF = 5
+MAX_REPLAY_BACKOFF = 600
+PROBE_TIMEOUT = 5
+
+# Idle connections are kept open this long (seconds)
+KEEPALIVE_TIMEOUT = 300
+
+# Characters of Orion's error body which are logged
+MAX_ERROR_LENGTH = 200
+
+# Successful updates are remembered this long (seconds), or since the oldest spooled batch
+DELIVERED_SECONDS = 24 * 3600
+
+http_ok = [200, 201, 204]
+
+logger = logging.getLogger('root')
+
+settings = {
+    'orion': None,
+    'url': None,
+    'headers': {},
+    'limit_entities': DEFAULT_LIMIT_ENTITIES,
+    'limit_target': DEFAULT_LIMIT_TARGET,
+    'action': DEFAULT_ACTION
+}
+
+# State of the batch size and concurrency control
+control = {
+    'limit_bytes': DEFAULT_LIMIT_BYTES,
+    'concurrency': 1.0,
+    'slow_start': True,
+    'min_latency': None,
+    'last_decrease': 0.0
+}
+
+stats = {
+    'entities': 0,
+    'bytes': 0,
+    'batches': 0,
+    'failed_batches': 0,
+    'failed_entities': 0,
+    'split_batches': 0,
+    'bisected_batches': 0,
+    'quarantined_entities': 0,
+    'retried_batches': 0,
+    'decreases': 0,
+    'connections': 0,
+    'seconds': 0.0
+}
+
+# Entity id -> time of the last successful update, to leave out the superseded replays
+# (and for change_cache). See forget_delivered
+delivered = {
+}
+
+session = None
+replay_task = None
+
+# Taken while entities are sent, so that replays and new cycles do not overlap
+posting = None
+
+
+def setup_writer(orion, service=None, path=None, limit_entities=DEFAULT_LIMIT_ENTITIES,
+                 limit_target=DEFAULT_LIMIT_TARGET, action=DEFAULT_ACTION, limit_bytes=DEFAULT_LIMIT_BYTES,
+                 spool=None, spool_bytes=DEFAULT_SPOOL_BYTES):
+    settings['orion'] = orion
+    settings['url'] = orion + '/v2/op/update'
+    settings['limit_entities'] = limit_entities
+    settings['limit_target'] = limit_target
+    settings['action'] = action
+
+    settings['headers'] = {
+        'Content-Type': 'application/json'
+    }
+    if service:
+        settings['headers']['FIWARE-SERVICE'] = service
+    if path:
+        settings['headers']['FIWARE-SERVICEPATH'] = path
+
+    control['limit_bytes'] = limit_bytes
+
+    if spool:
+        setup_spool(spool, spool_bytes)
+
+
+# Counts the new connections, to know how many times the keep-alive connections were not reused
+async def on_connection_create_end(client_session, context, params):
+    stats['connections'] += 1
+
+
+# The session is opened by the first post, inside the event loop of the harvester
+async def open_session():
+    global session, posting, replay_task
+
+    if session is None or session.closed:
+        trace = TraceConfig()
+        trace.on_connection_create_end.append(on_connection_create_end)
+
+        connector = TCPConnector(limit=settings['limit_target'], keepalive_timeout=KEEPALIVE_TIMEOUT)
+        session = ClientSession(connector=connector, trace_configs=[trace])
+        posting = Lock()
+
+        if spool_enabled():
+            replay_task = ensure_future(replay_loop())
+
+    return session
+
+
+# The spool is replayed once more before the session is closed, which is how the
+# harvesters that run only once send the backlog left by the previous runs
+async def close_writer():
+    global session, replay_task
+
+    if replay_task is not None:
+        replay_task.cancel()
+        try:
+            await replay_task
+        except CancelledError:
+            pass
+        replay_task = None
+
+    if session is not None and not session.closed:
+        if len(segments) > 0:
+            await replay_spool()
+        await session.close()
+
+    session = None
+
+
+# Takes from the queue the next batch (a list of entity indexes) within the limits of
+# entities and bytes. A single entity beyond the byte limit goes alone
+def next_batch(queue, pieces):
+    batch = [queue.popleft()]
+    size = len(pieces[batch[0]])
+
+    while len(queue) > 0 and len(batch) < settings['limit_entities']:
+        if size + len(pieces[queue[0]]) + 1 > control['limit_bytes']:
+            break
+        size += len(pieces[queue[0]]) + 1
+        batch.append(queue.popleft())
+
+    return batch
+
+
+def batch_payload(batch, pieces):
+    return '{{"actionType": {}, "entities": [{}]}}'.format(dumps(settings['action']), ','.join(pieces[i] for i in batch))
+
+
+# Sends the entities, returns the result of every batch (see post_one)
+async def post(entities):
+    logger.debug('Posting data to Orion started')
+
+    await open_session()
+
+    async with posting:
+        forget_delivered()
+        results = await dispatch(entities, spool_enabled())
+
+    logger.debug('Posting data to Orion ended')
+
+    return results
+
+
+# Entities are serialized only once, the batches are made when a slot is free,
+# so that they follow the limits of the moment (the halves of a rejected batch
+# go first, as they are). The batches which failed for a transient reason are
+# spooled, if asked
+async def dispatch(entities, spool=False):
+    start = time.perf_counter()
+
+    pieces = [dumps(entity) for entity in entities]
+    queue = deque(range(len(entities)))
+    halves = deque()
+    attempts = dict()
+
+    results = list()
+    running = set()
+    number = 0
+
+    while len(queue) > 0 or len(halves) > 0 or len(running) > 0:
+        while (len(queue) > 0 or len(halves) > 0) and len(running) < int(control['concurrency']):
+            batch = halves.popleft() if len(halves) > 0 else next_batch(queue, pieces)
+            running.add(ensure_future(post_one(number, batch, entities, pieces, attempts.get(batch[0], 0), spool)))
+            number += 1
+
+        done, running = await wait(running, return_when=FIRST_COMPLETED)
+
+        for task in done:
+            result = task.result()
+            # Entities to be sent again go first, in new batches
+            for i in result['entities_again']:
+                attempts[i] = result['attempt'] + 1
+            queue.extendleft(reversed(result['entities_again']))
+            halves.extend(result['halves'])
+            if result['final']:
+                results.append(result)
+
+    failed = [r for r in results if r['error'] is not None]
+    elapsed = time.perf_counter() - start
+
+    logger.info('Posted %s entities to Orion in %s batches (%s failed, %s entities not sent) in %.2fs '
+                '(%.0f entities/sec, concurrency %s, batch limit %s bytes)',
+                len(entities), len(results), len(failed), sum(r['entities'] for r in failed), elapsed,
+                len(entities) / elapsed if elapsed > 0 else 0, int(control['concurrency']), control['limit_bytes'])
+
+    return results
+
+
+# Sends a batch. A keep-alive connection closed by Orion while idle is detected only when
+# it is reused, so the batch is sent once more in a new connection
+async def post_one(number, batch, entities, pieces, attempt=0, spool=False, reconnect=True):
+    payload = batch_payload(batch, pieces)
+
+    result = {
+        'batch': number,
+        'entities': len(batch),
+        'bytes': len(payload),
+        'first': entities[batch[0]].get('id'),
+        'status': None,
+        'error': None,
+        'seconds': 0.0,
+        'attempt': attempt,
+        'entities_again': [],
+        'halves': [],
+        'final': True,
+        'spooled': False,
+        'quarantined': False
+    }
+
+    start = time.perf_counter()
+    retry_after = None
+
+    try:
+        async with session.post(settings['url'], headers=settings['headers'], data=payload) as response:
+            result['status'] = response.status
+            if response.status not in http_ok:
+                body = await response.text()
+                result['error'] = 'response code {}: {}'.format(response.status, body[:MAX_ERROR_LENGTH])
+                retry_after = response.headers.get('Retry-After')
+    except ServerDisconnectedError:
+        if reconnect:
+            return await post_one(number, batch, entities, pieces, attempt, spool, False)
+        result['error'] = 'connection closed by the server'
+    except ClientConnectorError:
+        result['error'] = 'connection problem'
+    except ToE:
+        result['error'] = 'timeout problem'
+    except ClientError as e:
+        result['error'] = 'client error ({})'.format(e)
+
+    result['seconds'] = time.perf_counter() - start
+
+    on_response(result['status'], result['seconds'])
+
+    if result['status'] == 413 and len(batch) > 1:
+        control['limit_bytes'] = max(MIN_LIMIT_BYTES, min(control['limit_bytes'], result['bytes']) // 2)
+        stats['split_batches'] += 1
+        logger.info('Batch %s (%s entities, %s bytes) too large, the batch limit is now %s bytes',
+                    number, len(batch), result['bytes'], control['limit_bytes'])
+        result['entities_again'] = batch
+        result['final'] = False
+        return result
+
+    if result['status'] in BISECT_STATUSES and len(batch) > 1:
+        stats['bisected_batches'] += 1
+        logger.info('Batch %s (%s entities from %s) rejected with %s, split in halves to find the rejected entities',
+                    number, len(batch), result['first'], result['status'])
+        result['halves'] = [batch[:len(batch) // 2], batch[len(batch) // 2:]]
+        result['final'] = False
+        return result
+
+    if is_overload(result['status']) and attempt < MAX_RETRIES:
+        delay = retry_delay(retry_after, attempt)
+        stats['retried_batches'] += 1
+        logger.info('Batch %s (%s entities from %s) answered %s, it will be sent again in %.1fs',
+                    number, len(batch), result['first'], result['status'], delay)
+        await sleep(delay)
+        result['entities_again'] = batch
+        result['final'] = False
+        return result
+
+    if result['error'] is None:
+        now = time.time()
+        for i in batch:
+            delivered[entities[i].get('id')] = now
+    elif spool and is_transient(result['status']):
+        spool_batch([entities[i] for i in batch], result['error'])
+        result['spooled'] = True
+    elif result['status'] in BISECT_STATUSES:
+        quarantine_entity(entities[batch[0]], result['error'])
+        stats['quarantined_entities'] += 1
+        result['quarantined'] = True
+
+    record(result)
+
+    return result
+
+
+# Drops the updates older than DELIVERED_SECONDS, unless a spooled batch is older
+# (a replay must not replace them)
+def forget_delivered():
+    limit = time.time() - DELIVERED_SECONDS
+
+    start = spool_start()
+    if start is not None:
+        limit = min(limit, start)
+
+    for entity_id in [i for i, t in delivered.items() if t < limit]:
+        del delivered[entity_id]
+
+
+def is_overload(status):
+    return status is not None and (status == 429 or status >= 500)
+
+
+# Failures which can go away by themselves, worth sending again later
+def is_transient(status):
+    return status is None or status == 408 or is_overload(status)
+
+
+def retry_delay(retry_after, attempt):
+    if retry_after is not None and retry_after.isdigit():
+        return float(retry_after)
+
+    return BACKOFF * 2 ** attempt
+
+
+# AIMD control of the concurrency: +1 per answer in slow start (doubles every round trip),
+# then +1 per round trip; halved at most once per round trip on overload
+def on_response(status, latency):
+    if status is None:
+        return
+
+    now = time.perf_counter()
+
+    # Only the latency of the accepted batches is meaningful, errors are answered early
+    if status in http_ok:
+        if control['min_latency'] is None or latency < control['min_latency']:
+            control['min_latency'] = latency
+        else:
+            control['min_latency'] *= 1 + LATENCY_DRIFT
+
+    slow = status in http_ok and latency > LATENCY_FACTOR * control['min_latency']
+    overloaded = is_overload(status) or slow
+
+    if overloaded:
+        if now - control['last_decrease'] > latency:
+            control['concurrency'] = max(1.0, control['concurrency'] / 2)
+            control['slow_start'] = False
+            control['last_decrease'] = now
+            stats['decreases'] += 1
+        return
+
+    if control['slow_start']:
+        control['concurrency'] += 1
+    else:
+        control['concurrency'] += 1 / control['concurrency']
+
+    control['concurrency'] = min(control['concurrency'], settings['limit_target'])
+
+
+async def orion_available():
+    try:
+        async with session.get(settings['orion'] + '/version', timeout=ClientTimeout(total=PROBE_TIMEOUT)) as response:
+            return response.status == 200
+    except (ClientError, ToE):
+        return False
+
+
+# Replays the spool, from the oldest segment, while Orion accepts the batches.
+# Returns False if Orion is not available (the replay stops at the first record which
+# failed for a transient reason, to be replayed again later). The records rejected
+# by Orion are dropped
+async def replay_spool():
+    if not await orion_available():
+        return False
+
+    async with posting:
+        while True:
+            segment = oldest_segment()
+            if segment is None:
+                return True
+
+            for position, group in pending_records(segment, settings['limit_entities'] * settings['limit_target']):
+                entities = sum(len(r['entities']) for r in group)
+                fresh = [e for r in group for e in r['entities'] if delivered.get(e.get('id'), 0) < r['time']]
+                spool_stats['superseded_entities'] += entities - len(fresh)
+
+                start = time.perf_counter()
+                results = await dispatch(fresh) if len(fresh) > 0 else []
+                spool_stats['replay_seconds'] += time.perf_counter() - start
+
+                if any(r['error'] is not None and is_transient(r['status']) for r in results):
+                    return False
+
+                spool_stats['replayed_entities'] += sum(r['entities'] for r in results if r['error'] is None)
+                spool_stats['dropped_entities'] += sum(r['entities'] for r in results if r['error'] is not None)
+                write_offset(segment, position, len(group), entities)
+
+            remove_segment(segment)
+            logger.info('Spool: %s', spool_report())
+
+
+async def replay_loop():
+    delay = REPLAY_BACKOFF
+
+    while True:
+        await sleep(delay)
+
+        if len(segments) == 0:
+            delay = REPLAY_BACKOFF
+        elif await replay_spool():
+            delay = REPLAY_BACKOFF
+        else:
+            delay = min(delay * 2, MAX_REPLAY_BACKOFF)
+            logger.debug('Spool: Orion not available, next replay in %ss', delay)
+
+
+def record(result):
+    stats['batches'] += 1
+    stats['entities'] += result['entities']
+    stats['bytes'] += result['bytes']
+    stats['seconds'] += result['seconds']
+
+    if result['error'] is None:
+        logger.debug('Batch %s (%s entities, %s bytes from %s) posted in %.3fs',
+                     result['batch'], result['entities'], result['bytes'], result['first'], result['seconds'])
+        return
+
+    stats['failed_batches'] += 1
+    stats['failed_entities'] += result['entities']
+
+    logger.error('Batch %s (%s entities from %s) failed in %.3fs due to the %s%s',
+                 result['batch'], result['entities'], result['first'], result['seconds'], result['error'],
+                 ', spooled' if result['spooled'] else ', quarantined' if result['quarantined'] else '')
+
+
+def writer_report():
+    report = '{entities} entities ({bytes} bytes) in {batches} batches, {failed_batches} batches failed ' \
+             '({failed_entities} entities), {split_batches} split, {bisected_batches} bisected, ' \
+             '{quarantined_entities} entities quarantined, {retried_batches} sent again, ' \
+             '{decreases} concurrency decreases, {connections} connections opened'.format(**stats)
+
+    if spool_enabled():
+        report += ', spool: ' + spool_report()
+
+    return report
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+
+Indexes a JSON Schema (previously parsed as a Python dictionary) so that the
+nodes looked up below any node of the schema are found in constant time.
+
+A lookup gives the same result as ldcontext_generator.find_node, which
+traverses the schema depth first every time it is called. The index is built
+in a single traversal of the schema: for every node (dict or list), the first
+node found below it for each of the indexed names.
+
+Lookups can also follow the $ref found in the schema, resolved with
+the local copies of the referenced documents (see schema_resolver), if the
+index is built with the base URL of the schema. The referenced documents are
+indexed once, the first time they are reached, and shared by all the schemas.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+from schema_resolver import ENTITY_ID, GEOMETRY, absolute_ref, resolve_ref, ref_base
+
+# Names of the nodes looked up by ldcontext_generator
+INDEXED_NODES = ('properties', '$ref', 'enum', 'format')
+
+
+# Indexes a schema, following the $ref if its base URL is given. The nodes are
+# identified by id(), the index keeps the schema so that they stay the same
+def index_schema(schema, node_names=INDEXED_NODES, base=None):
+    index = {
+        'schema': schema,
+        'names': frozenset(node_names),
+        'nodes': {},
+        'resolved': {}
+    }
+
+    if schema.__class__ is dict or schema.__class__ is list:
+        if base is None:
+            walk(schema, index['names'], index['nodes'])
+        else:
+            walk_resolved(schema, index['names'], base, index['resolved'])
+
+    return index
+
+
+# Finds a node below another one (None if there is no such node).
+# If the base URL of the node is given the $ref are followed.
+# Nodes which are not part of the schema nor of the referenced documents are indexed first
+def lookup(index, schema, node_name, base=None):
+    if schema.__class__ is not dict and schema.__class__ is not list:
+        return None
+
+    if base is None:
+        found = index['nodes'].get(id(schema))
+        if found is None:
+            found = walk(schema, index['names'], index['nodes'])
+    else:
+        found = index['resolved'].get(id(schema))
+        if found is None:
+            found = resolved_nodes.setdefault(index['names'], {}).get(id(schema))
+        if found is None:
+            found = walk_resolved(schema, index['names'], base, index['resolved'])
+
+    return found.get(node_name)
+
+
+# Result of the nodes where none of the names is found (never modified)
+NOT_FOUND = {}
+
+
+# Traverses a node as find_node does, but looking for all the names at once, and
+# keeps in nodes the result of every node traversed: id -> dict name -> first node found
+def walk(schema, node_names, nodes):
+    found = NOT_FOUND
+
+    # List positions are never equal to a name
+    members = schema.items() if schema.__class__ is dict else enumerate(schema)
+
+    for member, value in members:
+        # As find_node, a member with the name stops the search
+        # even if its value is null
+        if member in node_names and member not in found:
+            if found is NOT_FOUND:
+                found = {}
+            found[member] = value
+
+        if value.__class__ is dict or value.__class__ is list:
+            child_found = walk(value, node_names, nodes)
+            if child_found is NOT_FOUND:
+                continue
+
+            if found is NOT_FOUND:
+                found = {}
+            for name, child_value in child_found.items():
+                # a null found below is not a result
+                if child_value is not None and name not in found:
+                    found[name] = child_value
+
+    nodes[id(schema)] = found
+
+    return found
+
+
+# Results of walk_resolved for the nodes of the referenced documents (which are loaded
+# only once, so their ids do not change), shared by all the schemas: names -> id -> found
+resolved_nodes = {}
+
+# Results for the nodes pointed by a $ref, as (absolute $ref, names) -> found
+resolved_refs = {}
+
+# Used to stop on circular $ref
+resolving_refs = set()
+
+
+# Same as walk, but a $ref is replaced by the node it points to. Only the $ref which
+# point to ENTITY_ID or to a GeoJSON geometry (or that can't be resolved) are reported
+# as '$ref' (absolute). As in schema_types.ngsi_type, a geometry is a value of its own,
+# its "type" enum does not give terms
+def walk_resolved(schema, node_names, base, nodes):
+    found = NOT_FOUND
+
+    members = schema.items() if schema.__class__ is dict else enumerate(schema)
+
+    for member, value in members:
+        if member == '$ref' and value.__class__ is str:
+            child_found = walk_ref(absolute_ref(value, base), node_names)
+        else:
+            if member in node_names and member not in found:
+                if found is NOT_FOUND:
+                    found = {}
+                found[member] = value
+
+            if value.__class__ is not dict and value.__class__ is not list:
+                continue
+
+            child_found = walk_resolved(value, node_names, base, nodes)
+
+        if child_found is NOT_FOUND:
+            continue
+
+        if found is NOT_FOUND:
+            found = {}
+        for name, child_value in child_found.items():
+            if child_value is not None and name not in found:
+                found[name] = child_value
+
+    nodes[id(schema)] = found
+
+    return found
+
+
+def walk_ref(url, node_names):
+    key = (url, node_names)
+
+    if key in resolved_refs:
+        return resolved_refs[key]
+
+    if url in resolving_refs:
+        return NOT_FOUND
+
+    target = None
+    if url != ENTITY_ID and not url.startswith(GEOMETRY):
+        target = resolve_ref(url)
+
+    if target.__class__ is not dict and target.__class__ is not list:
+        found = {'$ref': url} if '$ref' in node_names else NOT_FOUND
+    else:
+        nodes = resolved_nodes.setdefault(node_names, {})
+        found = nodes.get(id(target))
+        if found is None:
+            resolving_refs.add(url)
+            found = walk_resolved(target, node_names, ref_base(url), nodes)
+            resolving_refs.discard(url)
+
+    resolved_refs[key] = found
+
+    return found
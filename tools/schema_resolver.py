@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+
+Resolves the $ref found in the JSON Schemas of the Data Models
+using the local copies of the referenced documents (no network access)
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import json
+from functools import lru_cache
+from urllib.parse import urljoin
+
+# Root folder of the Data Models repository
+base_folder = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Published URL prefix -> local folder
+url_folders = {
+    'https://fiware.github.io/data-models/': base_folder,
+    'https://fiware.github.io/dataModels/': base_folder
+}
+
+# Published URL -> local file
+url_files = {
+    'http://geojson.org/schema/Geometry.json': os.path.join(base_folder, 'geometry-schema.json')
+}
+
+# Used to detect attributes which are actually relationships
+ENTITY_ID = 'https://fiware.github.io/data-models/common-schema.json#/definitions/EntityIdentifierType'
+
+GEOMETRY = 'http://geojson.org/schema/Geometry.json'
+
+
+def read_json(infile):
+    with open(infile) as data_file:
+        data = json.loads(data_file.read())
+
+    return data
+
+
+# Returns the local file of a published document (None if it is not available)
+def local_file(url):
+    if url in url_files:
+        return url_files[url]
+
+    for prefix in url_folders:
+        if url.startswith(prefix):
+            return os.path.join(url_folders[prefix], url[len(prefix):])
+
+    return None
+
+
+# Returns the published URL of a local file
+def published_url(path):
+    path = os.path.abspath(path)
+
+    for url in url_files:
+        if url_files[url] == path:
+            return url
+
+    rel = os.path.relpath(path, base_folder).replace(os.sep, '/')
+
+    return 'https://fiware.github.io/data-models/' + rel
+
+
+# Base URL for the relative $ref of a schema
+def schema_base(schema, path):
+    if isinstance(schema, dict) and isinstance(schema.get('$id'), str) and schema['$id'].startswith('http'):
+        return schema['$id']
+
+    return published_url(path)
+
+
+# Makes a $ref absolute. Some schemas use '/definitions/...' to mean '#/definitions/...'
+def absolute_ref(ref, base):
+    if ref.startswith('/definitions/'):
+        ref = '#' + ref
+
+    return urljoin(base, ref)
+
+
+# Loads a document, every document is read only once
+@lru_cache(maxsize=None)
+def load_document(url):
+    path = local_file(url)
+
+    if path is None or not os.path.isfile(path):
+        return None
+
+    return read_json(path)
+
+
+# Finds the node of a document identified by a plain name fragment ("$id": "#LineString")
+def find_anchor(node, anchor):
+    if isinstance(node, dict):
+        if node.get('$id') == anchor:
+            return node
+        node = list(node.values())
+
+    if isinstance(node, list):
+        for item in node:
+            found = find_anchor(item, anchor)
+            if found is not None:
+                return found
+
+    return None
+
+
+# Returns the node pointed by an absolute $ref (None if it can't be resolved).
+# The returned node is shared, so it must not be modified
+@lru_cache(maxsize=None)
+def resolve_ref(url):
+    doc_url, _, pointer = url.partition('#')
+
+    node = load_document(doc_url)
+
+    if pointer and not pointer.startswith('/'):
+        return find_anchor(node, '#' + pointer)
+
+    for part in pointer.split('/')[1:]:
+        part = part.replace('~1', '/').replace('~0', '~')
+        if isinstance(node, dict):
+            node = node.get(part)
+        elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+            node = node[int(part)]
+        else:
+            node = None
+
+    return node
+
+
+# Base URL for the $ref found inside a resolved node
+def ref_base(url):
+    return url.partition('#')[0]
+
+
+# Returns a copy of a schema node where every $ref is replaced by the node it points to,
+# so the result does not depend on any other document. $ref which can't be
+# resolved, or which point back to a node being replaced (cycles), are kept as they are
+def dereference(node, base, resolving=frozenset()):
+    if isinstance(node, list):
+        return [dereference(item, base, resolving) for item in node]
+
+    if not isinstance(node, dict):
+        return node
+
+    ref = node.get('$ref')
+    if isinstance(ref, str):
+        url = absolute_ref(ref, base)
+        target = resolve_ref(url)
+        if target is not None and url not in resolving:
+            return dereference(target, ref_base(url), resolving | {url})
+
+    return {k: dereference(v, base, resolving) for k, v in node.items()}
+
+
+# The $ref left in a node by dereference
+def unresolved_refs(node, out=None):
+    if out is None:
+        out = set()
+
+    if isinstance(node, dict):
+        if isinstance(node.get('$ref'), str):
+            out.add(node['$ref'])
+        node = list(node.values())
+
+    if isinstance(node, list):
+        for item in node:
+            unresolved_refs(item, out)
+
+    return out
+
+
+# Returns a copy of a schema without any $ref (see dereference). Raises ValueError if some
+# of them can't be resolved with the local copies, as the validators would fetch them
+def self_contained(schema, base):
+    out = dereference(schema, base)
+
+    refs = unresolved_refs(out)
+    if len(refs) > 0:
+        raise ValueError('{}: $ref which cannot be resolved locally: {}'.format(base, ', '.join(sorted(refs))))
+
+    return out
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+
+Compiles the JSON Schema of a Data Model into a table that gives
+the NGSI type (Number, Text, DateTime, geo:json, Relationship, ...)
+of each attribute. Tables are compiled once and kept in memory.
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+from functools import lru_cache
+
+from schema_resolver import ENTITY_ID, GEOMETRY, read_json, schema_base, absolute_ref, resolve_ref, ref_base
+
+json_types = {
+    'number': 'Number',
+    'integer': 'Number',
+    'string': 'Text',
+    'boolean': 'Boolean',
+    'object': 'StructuredValue',
+    'array': 'StructuredValue'
+}
+
+# Used to avoid endless loops with recursive $ref
+MAX_DEPTH = 16
+
+
+# Collects the properties of a schema, including the ones coming from
+# allOf / anyOf / oneOf and $ref. Returns a dict name -> (node, base URL)
+def collect_properties(schema, base, out=None, depth=0):
+    if out is None:
+        out = {}
+
+    if not isinstance(schema, dict) or depth > MAX_DEPTH:
+        return out
+
+    if '$ref' in schema:
+        url = absolute_ref(schema['$ref'], base)
+        collect_properties(resolve_ref(url), ref_base(url), out, depth + 1)
+
+    for key in ['allOf', 'anyOf', 'oneOf']:
+        if isinstance(schema.get(key), list):
+            for sub_schema in schema[key]:
+                collect_properties(sub_schema, base, out, depth + 1)
+
+    properties = schema.get('properties')
+    if isinstance(properties, dict):
+        for p in properties:
+            out[p] = (properties[p], base)
+
+    return out
+
+
+# Returns the NGSI type of a property node of a JSON Schema
+# (None if it can't be determined)
+def ngsi_type(node, base, depth=0):
+    if not isinstance(node, dict) or depth > MAX_DEPTH:
+        return None
+
+    if '$ref' in node:
+        url = absolute_ref(node['$ref'], base)
+        if url == ENTITY_ID:
+            return 'Relationship'
+        if url.startswith(GEOMETRY):
+            return 'geo:json'
+        return ngsi_type(resolve_ref(url), ref_base(url), depth + 1)
+
+    if node.get('format') == 'date-time':
+        return 'DateTime'
+
+    node_type = node.get('type')
+
+    # A nullable value ("type": ["number", "null"]) has the type of its other member
+    if isinstance(node_type, list):
+        members = [t for t in node_type if t != 'null']
+        node_type = members[0] if len(members) == 1 else None
+
+    # An array of relationships, "items" being a schema or a list of them (tuple validation)
+    if node_type == 'array':
+        items = node.get('items')
+        if not isinstance(items, list):
+            items = [items]
+        if any(ngsi_type(item, base, depth + 1) == 'Relationship' for item in items):
+            return 'Relationship'
+
+    if isinstance(node_type, str) and node_type in json_types:
+        return json_types[node_type]
+
+    for key in ['allOf', 'anyOf', 'oneOf']:
+        if isinstance(node.get(key), list):
+            types = set([ngsi_type(sub_node, base, depth + 1) for sub_node in node[key]])
+            # An entity id or something else (e.g. {"type": "string", "format": "uri"}) is a relationship
+            if key != 'allOf' and 'Relationship' in types:
+                return 'Relationship'
+            if len(types) == 1:
+                return types.pop()
+
+    return None
+
+
+# Extracts the entity type (the first value of the enum of the 'type' property)
+def entity_type(schema, base):
+    properties = collect_properties(schema, base)
+
+    if 'type' in properties:
+        enum = properties['type'][0].get('enum')
+        if isinstance(enum, list) and len(enum) > 0:
+            return enum[0]
+
+    return None
+
+
+# Compiles a schema.json into a dict attribute -> NGSI type
+@lru_cache(maxsize=None)
+def compile_schema(schema_file):
+    schema = read_json(schema_file)
+    base = schema_base(schema, schema_file)
+
+    properties = collect_properties(schema, base)
+
+    out = {}
+
+    for p in properties:
+        if p == 'id' or p == 'type':
+            continue
+
+        p_type = ngsi_type(properties[p][0], base)
+
+        # By convention addresses are declared as PostalAddress
+        if p == 'address' and p_type == 'StructuredValue':
+            p_type = 'PostalAddress'
+
+        if p_type is not None:
+            out[p] = p_type
+
+    return out
+
+
+# Scans a folder and returns a dict entity type -> schema.json
+@lru_cache(maxsize=None)
+def schema_index(folder):
+    index = {}
+
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+
+        if 'schema.json' in filenames:
+            schema_file = os.path.join(dirpath, 'schema.json')
+            schema = read_json(schema_file)
+            schema_type = entity_type(schema, schema_base(schema, schema_file))
+            if schema_type is not None and schema_type not in index:
+                index[schema_type] = schema_file
+
+    return index
+
+
+# Returns the attribute -> NGSI type table of an entity type (empty if unknown)
+def attribute_types(type_name, folder):
+    schema_file = schema_index(folder).get(type_name)
+
+    if schema_file is None:
+        return {}
+
+    return compile_schema(schema_file)
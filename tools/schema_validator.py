@@ -0,0 +1,301 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Validates the examples of the Data Models against their JSON Schemas in a single
+process (replaces running ajv once per schema / example pair).
+
+Each schema.json is compiled once, together with the common schemas
+(common-schema.json, geometry-schema.json and the domain schemas) read from
+the local copies (see schema_resolver). Models are validated by a pool of processes.
+The result of each example is kept in a cache file by the hashes of the schema,
+the example and the common schemas, so unchanged examples are not validated again.
+
+As the ajv based validator, the normalized examples are skipped (schemas only
+describe the keyValues representation).
+
+Usage: schema_validator.py [-f folder] [-j workers] [--cache file] [--force]
+       schema_validator.py -s schema.json -d example.json
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from glob import glob
+from functools import lru_cache
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+from jsonschema import Draft7Validator, FormatChecker, RefResolver
+from jsonschema.exceptions import RefResolutionError
+
+from schema_resolver import base_folder, local_file, load_document, schema_base
+
+tools_folder = os.path.dirname(os.path.abspath(__file__))
+
+# Any change in these files invalidates the cache
+validator_files = ['schema_validator.py', 'schema_resolver.py']
+
+default_cache_file = os.path.join(tools_folder, 'schema_validator.cache.json')
+default_folder = os.path.join(tools_folder, '..', 'specs')
+
+SCHEMA_FILE = 'schema.json'
+# example.json, example-1.json, example-agriAlert.json... but not the normalized ones
+EXAMPLE_PATTERN = re.compile(r'^example(-(?!.*normalized)[^.]+)?\.json$')
+
+
+def read_json(infile):
+    with open(infile) as data_file:
+        data = json.loads(data_file.read())
+
+    return data
+
+
+def file_hash(path):
+    with open(path, 'rb') as data_file:
+        return hashlib.sha1(data_file.read()).hexdigest()
+
+
+# The documents referenced by the schemas
+def common_schemas():
+    return sorted(glob(os.path.join(base_folder, '*-schema.json')) +
+                  glob(os.path.join(base_folder, 'specs', '*', '*-schema.json')))
+
+
+# Version of the validation: this script and the common schemas
+def validator_version():
+    digest = hashlib.sha1()
+
+    for f in validator_files:
+        digest.update(file_hash(os.path.join(tools_folder, f)).encode())
+    for f in common_schemas():
+        digest.update(file_hash(f).encode())
+
+    return digest.hexdigest()
+
+
+# JSON pointer of the node of a document identified by a plain name fragment ("$id": "#LineString")
+def anchor_pointer(node, anchor, pointer=''):
+    if isinstance(node, dict):
+        if node.get('$id') == anchor:
+            return pointer
+        items = node.items()
+    elif isinstance(node, list):
+        items = enumerate(node)
+    else:
+        return None
+
+    for key, value in items:
+        found = anchor_pointer(value, anchor, pointer + '/' + str(key).replace('~', '~0').replace('/', '~1'))
+        if found is not None:
+            return found
+
+    return None
+
+
+# Some schemas use '/definitions/...' to mean '#/definitions/...' (see schema_resolver.absolute_ref),
+# others point to a plain name fragment, which RefResolver only resolves as a JSON pointer
+def fix_ref(ref):
+    if ref.startswith('/definitions/'):
+        return '#' + ref
+
+    url, _, fragment = ref.partition('#')
+    if url and fragment and not fragment.startswith('/'):
+        pointer = anchor_pointer(load_document(url), '#' + fragment)
+        if pointer is not None:
+            return url + '#' + pointer
+
+    return ref
+
+
+def fix_refs(node):
+    if isinstance(node, dict):
+        return {k: fix_ref(v) if k == '$ref' and isinstance(v, str) else fix_refs(v) for k, v in node.items()}
+
+    if isinstance(node, list):
+        return [fix_refs(v) for v in node]
+
+    return node
+
+
+# Loads a referenced document from its local copy
+def retrieve(url):
+    path = local_file(url)
+
+    if path is None or not os.path.isfile(path):
+        raise RefResolutionError('{} is not available locally'.format(url))
+
+    return fix_refs(read_json(path))
+
+
+# The common schemas by URL, loaded only once per process
+@lru_cache(maxsize=1)
+def common_store():
+    store = {}
+
+    for f in common_schemas():
+        schema = fix_refs(read_json(f))
+        store[schema_base(schema, f)] = schema
+
+    return store
+
+
+# Compiles a schema file into a validator (once per process)
+@lru_cache(maxsize=None)
+def compile_validator(schema_file):
+    schema = fix_refs(read_json(schema_file))
+
+    # The schema is resolved under its URL so that its relative $ref are resolved.
+    # RefResolver is deprecated since jsonschema 4.18 (replaced by the referencing library,
+    # which needs Python 3.8), it works because requirements.txt pins jsonschema 3.2.0
+    resolver = RefResolver(schema_base(schema, schema_file), schema, store=common_store(),
+                           handlers={'http': retrieve, 'https': retrieve})
+
+    return Draft7Validator(schema, resolver=resolver, format_checker=FormatChecker())
+
+
+# Returns the validation errors of an entity (an empty list if it is valid)
+def validate_entity(entity, validator):
+    return ['{}: {}'.format('/'.join(str(p) for p in error.absolute_path), error.message)
+            for error in validator.iter_errors(entity)]
+
+
+def find_examples(model_folder):
+    return sorted(os.path.join(model_folder, f) for f in os.listdir(model_folder) if EXAMPLE_PATTERN.match(f))
+
+
+# Finds the folders with a schema and examples to be validated
+def find_models(folder):
+    out = []
+
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        if SCHEMA_FILE in filenames and len(find_examples(dirpath)) > 0:
+            out.append(dirpath)
+
+    return out
+
+
+# Key of the result of an example: hash of everything the result depends on
+def validation_key(version, schema_hash, example_file):
+    return hashlib.sha1('/'.join([version, schema_hash, file_hash(example_file)]).encode()).hexdigest()
+
+
+# Validates the examples of a model. Runs in a worker process.
+# Returns the list of (example file, key, errors) validated
+def validate_model(model_folder, cache, version):
+    out = []
+
+    schema_file = os.path.join(model_folder, SCHEMA_FILE)
+    schema_hash = file_hash(schema_file)
+
+    validator = None
+
+    for example_file in find_examples(model_folder):
+        key = validation_key(version, schema_hash, example_file)
+        if example_file in cache and cache[example_file]['key'] == key:
+            continue
+
+        try:
+            if validator is None:
+                validator = compile_validator(schema_file)
+            errors = validate_entity(read_json(example_file), validator)
+        except Exception as e:
+            errors = ['cannot be validated: {}'.format(e)]
+
+        out.append((example_file, key, errors))
+
+    return out
+
+
+# Checks, without validating anything, if the results of a model are in the cache
+def is_up_to_date(model_folder, cache, version):
+    schema_hash = file_hash(os.path.join(model_folder, SCHEMA_FILE))
+
+    for example_file in find_examples(model_folder):
+        if example_file not in cache or cache[example_file]['key'] != validation_key(version, schema_hash, example_file):
+            return False
+
+    return True
+
+
+def validate_all(folder, cache_file, workers, force):
+    cache = dict()
+    if not force and cache_file and os.path.isfile(cache_file):
+        cache = read_json(cache_file)
+
+    version = validator_version()
+
+    models = [m for m in find_models(folder) if not is_up_to_date(m, cache, version)]
+
+    validated = []
+    if len(models) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(validate_model, m, cache, version) for m in models]
+            for future in futures:
+                validated.extend(future.result())
+
+    for f, key, errors in validated:
+        cache[f] = {
+            'key': key,
+            'errors': errors
+        }
+
+    # Examples removed since the last run are forgotten
+    for f in list(cache):
+        if not os.path.isfile(f):
+            del cache[f]
+
+    if cache_file:
+        with open(cache_file, 'w') as data_file:
+            data_file.write(json.dumps(cache, indent=4, sort_keys=True))
+            data_file.write("\n")
+
+    return cache, validated
+
+
+def main(args):
+    if args.s:
+        errors = validate_entity(read_json(args.d), compile_validator(os.path.abspath(args.s)))
+        print('{} {}'.format(args.d, 'invalid' if errors else 'valid'))
+        for error in errors:
+            print('    ' + error)
+        exit(1 if errors else 0)
+
+    start = time.perf_counter()
+
+    results, validated = validate_all(os.path.abspath(args.f), args.cache, args.j, args.force)
+
+    invalid = sorted(f for f in results if results[f]['errors'])
+    for f in invalid:
+        print(f + ' invalid')
+        for error in results[f]['errors']:
+            print('    ' + error)
+
+    print('{} examples ({} validated, {} from the cache), {} invalid in {:.2f}s'.format(
+        len(results), len(validated), len(results) - len(validated), len(invalid), time.perf_counter() - start))
+
+    exit(1 if invalid else 0)
+
+
+# Entry point
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-f', default=default_folder, help='folder (default: the specs folder)')
+    parser.add_argument('-j', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--cache', default=default_cache_file, help='cache file (empty to disable it)')
+    parser.add_argument('--force', action='store_true', help='validate everything again')
+    parser.add_argument('-s', help='schema file (validates only the example given with -d)')
+    parser.add_argument('-d', help='example file')
+
+    arguments = parser.parse_args()
+
+    if (arguments.s is None) != (arguments.d is None):
+        parser.error('-s and -d must be used together')
+
+    main(arguments)
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+
+Compact, queryable index of the terms of the LD @context generated by
+ldcontext_generator (SQLite database, terms_index.db).
+
+It answers term -> IRI, term -> schemas / specifications and
+entity type -> terms without loading context.jsonld or terms_list.yml.
+
+Usage: term_index.py [index file] iri|definition|schemas|specifications|terms [term or entity type]
+
+Copyright (c) 2019 FIWARE Foundation e.V.
+
+"""
+
+import os
+import sys
+import json
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE terms (
+    term TEXT PRIMARY KEY,
+    iri TEXT,
+    definition TEXT,
+    type TEXT
+) WITHOUT ROWID;
+CREATE TABLE urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT
+);
+CREATE TABLE term_schemas (
+    term TEXT,
+    url_id INTEGER,
+    PRIMARY KEY (term, url_id)
+) WITHOUT ROWID;
+CREATE TABLE term_specifications (
+    term TEXT,
+    url_id INTEGER,
+    PRIMARY KEY (term, url_id)
+) WITHOUT ROWID;
+CREATE TABLE type_terms (
+    entity_type TEXT,
+    term TEXT,
+    PRIMARY KEY (entity_type, term)
+) WITHOUT ROWID;
+'''
+
+
+# The IRI of a term of a @context (a string or a dictionary with '@id')
+def term_iri(definition):
+    if isinstance(definition, dict):
+        return definition.get('@id')
+
+    return definition
+
+
+# Writes the index. ld_context is the aggregated @context, terms_list the mappings
+# term -> schemas / specifications and entity_types a dict entity type -> terms
+def write_index(outfile, ld_context, terms_list, entity_types):
+    tmp_file = outfile + '.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+
+    conn = sqlite3.connect(tmp_file)
+
+    with conn:
+        conn.executescript(SCHEMA)
+
+        terms = terms_list['terms']
+
+        # Schema and specification URLs are stored only once
+        urls = {}
+        for t in terms:
+            for url in terms[t]['schemas'] + terms[t]['specifications']:
+                urls.setdefault(url, len(urls))
+
+        conn.executemany('INSERT INTO urls VALUES (?, ?)', [(urls[url], url) for url in urls])
+
+        conn.executemany('INSERT INTO terms VALUES (?, ?, ?, ?)', [
+            (t, term_iri(ld_context[t]), json.dumps(ld_context[t], sort_keys=True),
+             terms[t]['type'] if t in terms else None)
+            for t in ld_context])
+
+        conn.executemany('INSERT OR IGNORE INTO term_schemas VALUES (?, ?)', [
+            (t, urls[schema]) for t in terms for schema in terms[t]['schemas']])
+
+        conn.executemany('INSERT OR IGNORE INTO term_specifications VALUES (?, ?)', [
+            (t, urls[spec]) for t in terms for spec in terms[t]['specifications']])
+
+        conn.executemany('INSERT OR IGNORE INTO type_terms VALUES (?, ?)', [
+            (entity_type, t) for entity_type in entity_types for t in entity_types[entity_type]])
+
+    conn.execute('VACUUM')
+    conn.close()
+
+    os.replace(tmp_file, outfile)
+
+
+# Opens an index for querying (read only)
+def open_index(infile):
+    return sqlite3.connect('file:{}?mode=ro'.format(infile), uri=True, check_same_thread=False)
+
+
+def lookup_iri(conn, term):
+    row = conn.execute('SELECT iri FROM terms WHERE term = ?', (term,)).fetchone()
+
+    return row[0] if row else None
+
+
+def lookup_definition(conn, term):
+    row = conn.execute('SELECT definition FROM terms WHERE term = ?', (term,)).fetchone()
+
+    return json.loads(row[0]) if row else None
+
+
+def lookup_schemas(conn, term):
+    rows = conn.execute('SELECT url FROM term_schemas JOIN urls ON url_id = id WHERE term = ? ORDER BY url', (term,))
+
+    return [row[0] for row in rows]
+
+
+def lookup_specifications(conn, term):
+    rows = conn.execute('SELECT url FROM term_specifications JOIN urls ON url_id = id WHERE term = ? ORDER BY url',
+                        (term,))
+
+    return [row[0] for row in rows]
+
+
+def lookup_terms(conn, entity_type):
+    rows = conn.execute('SELECT term FROM type_terms WHERE entity_type = ? ORDER BY term', (entity_type,))
+
+    return [row[0] for row in rows]
+
+
+queries = {
+    'iri': lookup_iri,
+    'definition': lookup_definition,
+    'schemas': lookup_schemas,
+    'specifications': lookup_specifications,
+    'terms': lookup_terms
+}
+
+
+def main(args):
+    conn = open_index(args[1])
+
+    print(json.dumps(queries[args[2]](conn, args[3]), indent=4))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[2] not in queries:
+        print("Usage: term_index [index file] iri|definition|schemas|specifications|terms [term or entity type]")
+        exit(-1)
+
+    main(sys.argv)
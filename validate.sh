@@ -1,3 +1,8 @@
 #!/bin/sh
 
-ajv validate --v5 -s $1 -r common-schema.json -r geometry-schema.json -d $2
+# Validates an example against a schema (without arguments, all the examples under specs)
+if [ $# -eq 0 ]; then
+    python3 "$(dirname "$0")/tools/schema_validator.py"
+else
+    python3 "$(dirname "$0")/tools/schema_validator.py" -s $1 -d $2
+fi